@@ -4,18 +4,30 @@ from flask import Flask
 from config import Config
 
 from .modules.arm_control import ArmController
-from .modules.vision import VisionProcessor
+from .modules.vision import VisionProcessor, ORGANS_INFO
 from .modules.car_control import CarController
+from .modules.streaming import MjpegBroadcaster
+from .modules.events import EventHub, StatusPublisher
+from .modules.sample_registry import SampleRegistry
+from .modules.serial_io import SerialReactor
 
 
 def stop_background_threads(app):
     """A function to gracefully stop all running threads."""
+    if hasattr(app, "stream_broadcaster") and app.stream_broadcaster:
+        app.stream_broadcaster.stop()
+    if hasattr(app, "status_publisher") and app.status_publisher:
+        app.status_publisher.stop()
+    if hasattr(app, "event_hub") and app.event_hub:
+        app.event_hub.stop()
     if hasattr(app, "vision_processor") and app.vision_processor:
         app.vision_processor.stop()
     if hasattr(app, "arm_controller") and app.arm_controller:
         app.arm_controller.stop()
     if hasattr(app, "car_controller") and app.car_controller:
         app.car_controller.stop_thread()
+    if hasattr(app, "serial_reactor") and app.serial_reactor:
+        app.serial_reactor.stop()
     print("All background threads have been stopped.")
 
 
@@ -29,15 +41,48 @@ def start_background_services(app):
         "task2_target": None,
     }
 
-    app.arm_controller = ArmController(state_manager=app.state_manager)
-    app.car_controller = CarController(state_manager=app.state_manager)
+    # --- [新增] 两个串口共用一个 I/O 线程, 有数据立即分发 ---
+    app.serial_reactor = SerialReactor()
+    app.arm_controller = ArmController(
+        state_manager=app.state_manager, io_reactor=app.serial_reactor
+    )
+    app.car_controller = CarController(
+        state_manager=app.state_manager, io_reactor=app.serial_reactor
+    )
     app.vision_processor = VisionProcessor()
 
     app.car_controller.set_arm_controller(app.arm_controller)
     app.arm_controller.set_car_controller(app.car_controller)
     app.arm_controller.set_vision_processor(app.vision_processor)
-
+    app.arm_controller.set_vision_stream_rate(
+        app.config.get("ARM_VISION_MAX_RATE", 20),
+        app.config.get("ARM_VISION_KEEPALIVE", 1.0),
+    )
+    app.arm_controller.set_vision_batch(app.config.get("ARM_VISION_BATCH", False))
+    app.serial_reactor.start()
+    app.vision_processor.set_sample_registry(
+        SampleRegistry(app.config.get("SAMPLE_REGISTRY_PATH"), fallback=ORGANS_INFO)
+    )
+
+    # --- [新增] SSE 推送：检测结果、系统状态与收发日志 ---
+    app.event_hub = EventHub()
+    app.arm_controller.set_event_hub(app.event_hub)
+    app.car_controller.set_event_hub(app.event_hub)
+
+    app.vision_processor.enable_frame_ring(
+        app.config.get("FRAME_RING_CAPACITY", 0),
+        app.config.get("FRAME_RING_SLOT_BYTES", 64 * 1024),
+    )
     app.vision_processor.start()
+
+    app.stream_broadcaster = MjpegBroadcaster(
+        app.vision_processor, max_viewers=app.config.get("MAX_STREAM_VIEWERS", 5)
+    )
+
+    app.status_publisher = StatusPublisher(
+        app.event_hub, app.vision_processor, app.state_manager, app.arm_controller
+    )
+    app.status_publisher.start()
     print("All background services started.")
 
 
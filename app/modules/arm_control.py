@@ -10,27 +10,79 @@ except (ImportError, ModuleNotFoundError):
     print("!!! maix.uart not found, switching to MOCK mode for development. !!!")
     from .maix_mock import uart
 
+from .metrics import REGISTRY, SERIAL_MESSAGES_RECEIVED, SERIAL_DISPATCH_SECONDS
+from .serial_io import SerialReactor, SerialWriter, log_time
+from .serial_protocol import FrameDecoder, TEXT, BatchPacketBuilder, encode_packet
+
+VISION_PACKETS = REGISTRY.counter(
+    "arm_vision_packets_total",
+    "Vision stream decisions per target (sent, keepalive, suppressed).",
+    ("target", "outcome"),
+)
+
+# 流式发送的遥测包类型 (0x01 色块, 0x02 AprilTag, 0x03 批量)
+TELEMETRY_TYPES = (0x01, 0x02, 0x03)
+
 
 class ArmController:
-    def __init__(self, port="/dev/ttyS0", baudrate=115200, state_manager=None):
+    def __init__(
+        self, port="/dev/ttyS0", baudrate=115200, state_manager=None, io_reactor=None
+    ):
         self.serial_port = None
         self.received_log = collections.deque(maxlen=50)
         self.sent_log = collections.deque(maxlen=50)
         self.lock = threading.Lock()
-        self.send_lock = threading.Lock()
+        self._messages_received = SERIAL_MESSAGES_RECEIVED.labels("arm")
+        self._dispatch_seconds = SERIAL_DISPATCH_SECONDS.labels("arm")
+        self.decoder = FrameDecoder("arm")
         self.car_controller = None
         self.vision_processor = None
+        self.event_hub = None
         self.vision_stream_active = False
         self.vision_stream_thread = None
-        self.VISION_SEND_INTERVAL = 0.5
+        # 有新的检测结果就发送, 但不超过 VISION_MAX_RATE 次/秒;
+        # 变化小于死区的不发, 目标一直不动时每 VISION_KEEPALIVE_INTERVAL 秒补发一次
+        self.VISION_MAX_RATE = 20.0
+        self.VISION_KEEPALIVE_INTERVAL = 1.0
+        # (offset_x, offset_y, angle/distance) 的死区; 第4个字段 (颜色/ID) 变化总是发送
+        self.VISION_DEADBAND = {"color_block": (2, 2, 2), "apriltag": (2, 2, 1)}
+        self._last_vision_sent = {}
+        # 0x03 批量包需要机械臂固件支持, 默认仍发送 0x01/0x02
+        self.vision_batch_enabled = False
+        self.batch_builder = BatchPacketBuilder()
+        # 遥测包默认不打印到控制台 (仍记录在发送日志里)
+        self.print_telemetry = False
+        self._vision_packets = {
+            (target, outcome): VISION_PACKETS.labels(target, outcome)
+            for target in ("color_block", "apriltag")
+            for outcome in ("sent", "keepalive", "suppressed")
+        }
+        # 数据从发送到机械臂执行大约还需要的时间, 发送前把目标位置外推到这一时刻
+        self.VISION_ACTUATION_LATENCY = 0.1
+        self.vision_prediction_enabled = True
         self.state_manager = state_manager
+        self.stopped = False
+        self.io_reactor = None
+        self.owns_reactor = False
+        self.writer = None
 
         try:
             self.serial_port = uart.UART(port, baudrate)
-            self.stopped = False
-            self.reader_thread = threading.Thread(target=self._read_loop, daemon=True)
-            self.reader_thread.start()
-            print(f"Arm controller initialized on {port} and reader thread started.")
+            # 所有发送都经过写线程, 调用方只负责入队
+            self.writer = SerialWriter("arm", self.serial_port, on_sent=self._on_sent)
+            self.writer.start()
+            # 没有传入共享的 I/O 线程时自己建一个
+            self.owns_reactor = io_reactor is None
+            self.io_reactor = io_reactor or SerialReactor()
+            self.io_reactor.register(
+                "arm",
+                self.serial_port,
+                self._on_serial_data,
+                on_idle=self._on_serial_idle,
+            )
+            if self.owns_reactor:
+                self.io_reactor.start()
+            print(f"Arm controller initialized on {port}.")
         except Exception as e:
             print(f"!!! Failed to initialize arm controller on {port}: {e}")
 
@@ -42,27 +94,138 @@ class ArmController:
         self.vision_processor = vision_processor
         print("Vision processor has been linked to Arm controller.")
 
+    def set_event_hub(self, event_hub):
+        self.event_hub = event_hub
+
+    def _emit(self, event_type, data):
+        if self.event_hub:
+            self.event_hub.publish(event_type, data)
+
+    def set_vision_batch(self, enabled):
+        self.vision_batch_enabled = bool(enabled)
+
+    def set_vision_stream_rate(self, max_rate, keepalive_interval=None):
+        self.VISION_MAX_RATE = max(float(max_rate), 0.1)
+        if keepalive_interval is not None:
+            self.VISION_KEEPALIVE_INTERVAL = float(keepalive_interval)
+
     def _vision_stream_loop(self):
+        last_seq = 0
+        next_send = 0.0
+        self._last_vision_sent = {}
         while self.vision_stream_active and not self.stopped:
-            if self.vision_processor:
-                latest_data = self.vision_processor.get_latest_data()
-                blob_data = latest_data.get("color_block")
-                if blob_data and blob_data.get("detected"):
-                    self.send_arm_offset_and_angle_bulk(
-                        blob_data.get("offset_x", 0),
-                        blob_data.get("offset_y", 0),
-                        blob_data.get("angle", 0),
-                        blob_data.get("color_index", 0),
-                    )
-                tag_data = latest_data.get("apriltag")
-                if tag_data and tag_data.get("detected"):
-                    self.send_april_tag_offset(
-                        tag_data.get("offset_x", 0),
-                        tag_data.get("offset_y", 0),
-                        tag_data.get("distance", 0),
-                        tag_data.get("id", -1),  # 传入ID，如果不存在则默认为-1
+            if not self.vision_processor:
+                time.sleep(0.1)
+                continue
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                # 限速: 等到下一次允许发送, 再取那时最新的结果
+                time.sleep(delay)
+            snapshot = self.vision_processor.wait_for_snapshot(last_seq, timeout=0.2)
+            if snapshot is not None:
+                last_seq = snapshot.seq
+            else:
+                snapshot = self.vision_processor.get_latest_snapshot()
+            latest_data = snapshot.data
+            now = time.monotonic()
+            targets = {}
+            blob_data = latest_data.get("color_block")
+            if blob_data and blob_data.get("detected"):
+                target = self._predicted_target("color_block", blob_data)
+                targets["color_block"] = (
+                    int(target.get("offset_x", 0)),
+                    int(target.get("offset_y", 0)),
+                    int(target.get("angle", 0)),
+                    blob_data.get("color_index", 0),
+                )
+            else:
+                self._last_vision_sent.pop("color_block", None)
+            tag_data = latest_data.get("apriltag")
+            if tag_data and tag_data.get("detected"):
+                target = self._predicted_target("apriltag", tag_data)
+                targets["apriltag"] = (
+                    int(target.get("offset_x", 0)),
+                    int(target.get("offset_y", 0)),
+                    int(target.get("distance", 0)),
+                    tag_data.get("id", -1),  # 传入ID，如果不存在则默认为-1
+                )
+            else:
+                self._last_vision_sent.pop("apriltag", None)
+
+            due = {}
+            for name, values in targets.items():
+                outcome = self._vision_outcome(name, values, now)
+                self._vision_packets[(name, outcome or "suppressed")].inc()
+                if outcome:
+                    due[name] = values
+            if not due:
+                continue
+            if self.vision_batch_enabled:
+                # 一个包带上这一帧的全部目标, 机械臂拿到的是同一时刻的数据
+                blobs = self._batch_blob_records(blob_data, targets.get("color_block"))
+                tags = [targets["apriltag"]] if "apriltag" in targets else []
+                self.send_vision_batch(snapshot.timestamp, blobs, tags)
+                due = targets
+            else:
+                if "color_block" in due:
+                    self.send_arm_offset_and_angle_bulk(*due["color_block"])
+                if "apriltag" in due:
+                    self.send_april_tag_offset(*due["apriltag"])
+            for name, values in due.items():
+                self._last_vision_sent[name] = (values, now)
+            next_send = now + 1.0 / self.VISION_MAX_RATE
+
+    def _vision_outcome(self, name, values, now):
+        """Why `values` should be sent ("sent" / "keepalive"), or None to suppress."""
+        last = self._last_vision_sent.get(name)
+        if last is None or values[3] != last[0][3]:
+            return "sent"
+        if any(
+            abs(value - previous) > deadband
+            for value, previous, deadband in zip(
+                values, last[0], self.VISION_DEADBAND[name]
+            )
+        ):
+            return "sent"
+        if now - last[1] >= self.VISION_KEEPALIVE_INTERVAL:
+            return "keepalive"
+        return None
+
+    def _batch_blob_records(self, blob_data, primary):
+        """The tracked blob first, then the other blobs of a multi-color frame."""
+        records = [primary] if primary else []
+        if not blob_data or not blob_data.get("blobs"):
+            return records
+        skipped = primary is None
+        for color_records in blob_data["blobs"].values():
+            for record in color_records:
+                if not skipped and (
+                    record["offset_x"] == blob_data["offset_x"]
+                    and record["offset_y"] == blob_data["offset_y"]
+                    and record["color_index"] == blob_data["color_index"]
+                ):
+                    skipped = True
+                    continue
+                records.append(
+                    (
+                        record["offset_x"],
+                        record["offset_y"],
+                        int(record["angle"]),
+                        record["color_index"],
                     )
-            time.sleep(self.VISION_SEND_INTERVAL)
+                )
+        return records
+
+    def _predicted_target(self, name, data):
+        """Target values extrapolated to when the arm acts on them, else `data`."""
+        if not self.vision_prediction_enabled:
+            return data
+        predicted = self.vision_processor.predict_target(
+            name, time.time() + self.VISION_ACTUATION_LATENCY
+        )
+        if not predicted:
+            return data
+        return {key: int(round(value)) for key, value in predicted.items()}
 
     def start_vision_streams(self):
         if not self.vision_stream_active:
@@ -84,61 +247,66 @@ class ArmController:
         return {"is_active": self.vision_stream_active}
 
     def send_task1_command(self):
-        with self.send_lock:
-            if not self.serial_port:
-                return "错误: 串口不可用"
-            try:
-                task1_counter = 0
-                while task1_counter < 5:
-                    payload = struct.pack(">h", 0)
-                    packet = self._create_packet(0x10, payload)
-                    log_message = "任务指令: Task 1 (0x10)"
-                    self._log_and_send(log_message, packet)
-                    self.start_vision_streams()
-                    task1_counter = task1_counter + 1
-                return log_message
-            except Exception as e:
-                return f"!!! 打包 Task 1 指令时出错: {e}"
+        if not self.serial_port:
+            return "错误: 串口不可用"
+        try:
+            task1_counter = 0
+            while task1_counter < 5:
+                payload = struct.pack(">h", 0)
+                packet = self._create_packet(0x10, payload)
+                log_message = "任务指令: Task 1 (0x10)"
+                self._log_and_send(log_message, packet)
+                self.start_vision_streams()
+                task1_counter = task1_counter + 1
+            return log_message
+        except Exception as e:
+            return f"!!! 打包 Task 1 指令时出错: {e}"
 
     def send_task2_command(self, row, col, color_id):
-        with self.send_lock:
-            if not self.serial_port:
-                return "错误: 串口不可用"
-            try:
-                payload = struct.pack(">hhh", int(row), int(col), int(color_id))
-                packet = self._create_packet(0x11, payload)
-                log_message = (
-                    f"任务指令: Task 2 (0x11) -> R:{row}, C:{col}, Color:{color_id}"
+        if not self.serial_port:
+            return "错误: 串口不可用"
+        try:
+            payload = struct.pack(">hhh", int(row), int(col), int(color_id))
+            packet = self._create_packet(0x11, payload)
+            log_message = (
+                f"任务指令: Task 2 (0x11) -> R:{row}, C:{col}, Color:{color_id}"
+            )
+
+            # --- [核心修改] 发送指令后，立刻切换到自动模式 ---
+            if self.state_manager:
+                self.state_manager["status"] = "TASK_AUTO"
+                print(
+                    f"--- System state changed to: {self.state_manager['status']} (triggered by Pegboard click) ---"
                 )
+            self._log_and_send(log_message, packet)
+            self.start_vision_streams()
+            return log_message
+        except Exception as e:
+            return f"!!! 打包 Task 2 指令时出错: {e}"
 
-                # --- [核心修改] 发送指令后，立刻切换到自动模式 ---
-                if self.state_manager:
-                    self.state_manager["status"] = "TASK_AUTO"
-                    print(
-                        f"--- System state changed to: {self.state_manager['status']} (triggered by Pegboard click) ---"
-                    )
-                self._log_and_send(log_message, packet)
-                self.start_vision_streams()
-                return log_message
-            except Exception as e:
-                return f"!!! 打包 Task 2 指令时出错: {e}"
-
-    def _read_loop(self):
-        while not self.stopped:
-            if self.serial_port:
-                try:
-                    data = self.serial_port.read()
-                    if data:
-                        message = data.decode("utf-8", errors="ignore").strip()
-                        if message:
-                            with self.lock:
-                                self.received_log.append(
-                                    f"[{time.strftime('%H:%M:%S')}] {message}"
-                                )
-                            self.process_arm_message(message)
-                except Exception as e:
-                    time.sleep(1)
-            time.sleep(0.01)
+    def _on_serial_data(self, data):
+        """Called by the I/O reactor as soon as bytes arrive from the arm."""
+        for frame in self.decoder.feed(data):
+            self._handle_frame(frame)
+
+    def _on_serial_idle(self):
+        # 没有换行结尾的消息在线路空闲后才交出来
+        for frame in self.decoder.flush():
+            self._handle_frame(frame)
+
+    def _handle_frame(self, frame):
+        if frame.kind == TEXT:
+            message = frame.payload
+        else:
+            message = f"[0x{frame.type:02X}] {frame.payload.hex().upper()}"
+        self._messages_received.inc()
+        with self._dispatch_seconds.time():
+            entry = f"[{log_time()}] {message}"
+            with self.lock:
+                self.received_log.append(entry)
+            self._emit("arm_log", {"entry": entry})
+            if frame.kind == TEXT:
+                self.process_arm_message(message)
 
     def process_arm_message(self, message):
         task_id_finished = None
@@ -165,8 +333,14 @@ class ArmController:
     def stop(self):
         self.stopped = True
         self.stop_vision_streams()
-        if self.reader_thread and self.reader_thread.is_alive():
-            self.reader_thread.join()
+        if self.io_reactor:
+            self.io_reactor.unregister("arm")
+            if self.owns_reactor:
+                self.io_reactor.stop()
+        if self.writer:
+            self.writer.stop()
+        if self.serial_port and hasattr(self.serial_port, "close"):
+            self.serial_port.close()
 
     def get_received_log(self):
         with self.lock:
@@ -176,60 +350,78 @@ class ArmController:
         return list(self.sent_log)
 
     def _create_packet(self, data_type, payload):
-        length = len(payload)
-        header = bytearray([0xAA, 0x55])
-        dt_byte = data_type.to_bytes(1, "big")
-        length_byte = length.to_bytes(1, "big")
-        checksum_val = (data_type + length + sum(payload)) & 0xFF
-        checksum_byte = checksum_val.to_bytes(1, "big")
-        tail = bytearray([0x0D, 0x0A])
-        packet = header + dt_byte + length_byte + payload + checksum_byte + tail
-        return packet
-
-    def _log_and_send(self, log_message, packet):
-        timestamped_log = f"[{time.strftime('%H:%M:%S')}] {log_message}"
-        self.sent_log.append(timestamped_log)
-        print(f"发送 -> {log_message} (Packet: {packet.hex().upper()})")
-        if self.serial_port:
-            self.serial_port.write(bytes(packet))
+        return encode_packet(data_type, payload)
+
+    def _log_and_send(self, log_message, packet, key=None):
+        """Queues `packet`; with a `key` it is telemetry and may be superseded."""
+        self.writer.send(bytes(packet), log_message, key)
         return log_message
 
+    def _on_sent(self, log_message, data):
+        timestamped_log = f"[{log_time()}] {log_message}"
+        self.sent_log.append(timestamped_log)
+        self._emit("arm_sent_log", {"entry": timestamped_log})
+        if self.print_telemetry or data[2] not in TELEMETRY_TYPES:
+            print(f"发送 -> {log_message} (Packet: {data.hex().upper()})")
+
+    def get_serial_stats(self):
+        return {
+            "decoder": self.decoder.get_stats(),
+            "writer": self.writer.get_stats() if self.writer else None,
+            "vision_stream": {
+                f"{target}_{outcome}": int(counter.value)
+                for (target, outcome), counter in self._vision_packets.items()
+            },
+        }
+
     def send_arm_offset_and_angle_bulk(self, offset_x, offset_y, angle, color_index):
-        with self.send_lock:
-            if not self.serial_port:
-                return "错误: 串口不可用"
-            try:
-                payload = struct.pack(
-                    ">hhhh",
-                    int(offset_x),
-                    int(offset_y),
-                    int(angle),
-                    int(color_index),
-                )
-                packet = self._create_packet(0x01, payload)
-                return self._log_and_send(
-                    f"色块: X:{offset_x}, Y:{offset_y}, A:{int(angle)}, C:{color_index}",
-                    packet,
-                )
-            except Exception as e:
-                return f"!!! 打包色块数据时出错: {e}"
+        if not self.serial_port:
+            return "错误: 串口不可用"
+        try:
+            payload = struct.pack(
+                ">hhhh",
+                int(offset_x),
+                int(offset_y),
+                int(angle),
+                int(color_index),
+            )
+            packet = self._create_packet(0x01, payload)
+            return self._log_and_send(
+                f"色块: X:{offset_x}, Y:{offset_y}, A:{int(angle)}, C:{color_index}",
+                packet,
+                key=0x01,
+            )
+        except Exception as e:
+            return f"!!! 打包色块数据时出错: {e}"
 
     def send_april_tag_offset(self, center_x, center_y, distance, tag_id):
-        with self.send_lock:
-            if not self.serial_port:
-                return "错误: 串口不可用"
-            try:
-                payload = struct.pack(
-                    ">hhhh",
-                    int(center_x),
-                    int(center_y),
-                    int(distance),
-                    int(tag_id),
-                )
-                packet = self._create_packet(0x02, payload)
-                return self._log_and_send(
-                    f"AprilTag: X:{center_x}, Y:{center_y}, D:{distance}, C:{tag_id}",
-                    packet,
-                )
-            except Exception as e:
-                return f"!!! 打包AprilTag数据时出错: {e}"
+        if not self.serial_port:
+            return "错误: 串口不可用"
+        try:
+            payload = struct.pack(
+                ">hhhh",
+                int(center_x),
+                int(center_y),
+                int(distance),
+                int(tag_id),
+            )
+            packet = self._create_packet(0x02, payload)
+            return self._log_and_send(
+                f"AprilTag: X:{center_x}, Y:{center_y}, D:{distance}, C:{tag_id}",
+                packet,
+                key=0x02,
+            )
+        except Exception as e:
+            return f"!!! 打包AprilTag数据时出错: {e}"
+
+    def send_vision_batch(self, timestamp, blobs, tags):
+        """One 0x03 packet with every blob and tag record of a frame."""
+        if not self.serial_port:
+            return "错误: 串口不可用"
+        try:
+            packet = self.batch_builder.build(int(timestamp * 1000), blobs, tags)
+            return self._log_and_send(
+                f"批量: 色块 {len(blobs)}, AprilTag {len(tags)}", packet, key=0x03
+            )
+        except Exception as e:
+            return f"!!! 打包批量视觉数据时出错: {e}"
@@ -15,26 +15,49 @@ except (ImportError, ModuleNotFoundError):
     pinmap = MockPinmap()
     from .maix_mock import uart
 
+from .metrics import SERIAL_MESSAGES_RECEIVED, SERIAL_DISPATCH_SECONDS
+from .serial_io import SerialReactor, SerialWriter, log_time
+from .serial_protocol import FrameDecoder, TEXT
+
 
 class CarController:
-    def __init__(self, port="/dev/ttyS2", baudrate=115200, state_manager=None):
+    def __init__(
+        self, port="/dev/ttyS2", baudrate=115200, state_manager=None, io_reactor=None
+    ):
         self.serial_port = None
         self.received_log = collections.deque(maxlen=50)
         self.sent_log = collections.deque(maxlen=50)
-        self.send_lock = threading.Lock()
+        self._messages_received = SERIAL_MESSAGES_RECEIVED.labels("car")
+        self._dispatch_seconds = SERIAL_DISPATCH_SECONDS.labels("car")
+        self.decoder = FrameDecoder("car")
         self.reader_lock = threading.Lock()
         self.task_stage = 1
         self.arm_controller = None
+        self.event_hub = None
         self.state_manager = state_manager
+        self.stopped = False
+        self.io_reactor = None
+        self.owns_reactor = False
+        self.writer = None
 
         try:
             pinmap.set_pin_function("A28", "UART2_TX")
             pinmap.set_pin_function("A29", "UART2_RX")
             self.serial_port = uart.UART(port, baudrate)
-            self.stopped = False
-            self.reader_thread = threading.Thread(target=self._read_loop, daemon=True)
-            self.reader_thread.start()
-            print(f"Car controller initialized on {port} and reader thread started.")
+            self.writer = SerialWriter("car", self.serial_port, on_sent=self._on_sent)
+            self.writer.start()
+            # 没有传入共享的 I/O 线程时自己建一个
+            self.owns_reactor = io_reactor is None
+            self.io_reactor = io_reactor or SerialReactor()
+            self.io_reactor.register(
+                "car",
+                self.serial_port,
+                self._on_serial_data,
+                on_idle=self._on_serial_idle,
+            )
+            if self.owns_reactor:
+                self.io_reactor.start()
+            print(f"Car controller initialized on {port}.")
         except Exception as e:
             print(f"!!! Failed to initialize car controller on {port}: {e}")
 
@@ -42,22 +65,38 @@ class CarController:
         self.arm_controller = arm_controller
         print("Arm controller has been linked to Car controller.")
 
-    def _read_loop(self):
-        while not self.stopped:
-            if self.serial_port:
-                try:
-                    data = self.serial_port.read()
-                    if data:
-                        message = data.decode("utf-8", errors="ignore").strip()
-                        if message:
-                            with self.reader_lock:
-                                self.received_log.append(
-                                    f"[{time.strftime('%H:%M:%S')}] {message}"
-                                )
-                            self.process_task_message(message)
-                except Exception as e:
-                    time.sleep(1)
-            time.sleep(0.01)
+    def set_event_hub(self, event_hub):
+        self.event_hub = event_hub
+
+    def _emit(self, event_type, data):
+        if self.event_hub:
+            self.event_hub.publish(event_type, data)
+
+    def _append_received_log(self, entry):
+        with self.reader_lock:
+            self.received_log.append(entry)
+        self._emit("car_log", {"entry": entry})
+
+    def _on_serial_data(self, data):
+        """Called by the I/O reactor as soon as bytes arrive from the car."""
+        for frame in self.decoder.feed(data):
+            self._handle_frame(frame)
+
+    def _on_serial_idle(self):
+        # 没有换行结尾的消息在线路空闲后才交出来
+        for frame in self.decoder.flush():
+            self._handle_frame(frame)
+
+    def _handle_frame(self, frame):
+        if frame.kind == TEXT:
+            message = frame.payload
+        else:
+            message = f"[0x{frame.type:02X}] {frame.payload.hex().upper()}"
+        self._messages_received.inc()
+        with self._dispatch_seconds.time():
+            self._append_received_log(f"[{log_time()}] {message}")
+            if frame.kind == TEXT:
+                self.process_task_message(message)
 
     def simulate_task1_start(self):
         """Simulates receiving 'task1_start' from the car."""
@@ -65,9 +104,8 @@ class CarController:
         if not self.arm_controller:
             return "Arm controller not available for simulation."
         self.arm_controller.send_task1_command()
-        simulated_message = f"[{time.strftime('%H:%M:%S')}] [SIMULATION] task1_start"
-        with self.reader_lock:
-            self.received_log.append(simulated_message)
+        simulated_message = f"[{log_time()}] [SIMULATION] task1_start"
+        self._append_received_log(simulated_message)
         return "Task 1 simulation started."
 
     def simulate_task2_start(self):
@@ -88,9 +126,8 @@ class CarController:
         self.arm_controller.send_task2_command(test_row, test_col, test_color_id)
 
         # Log the simulation action
-        simulated_message = f"[{time.strftime('%H:%M:%S')}] [SIMULATION] Task 2 started with test parameters (R:{test_row}, C:{test_col}, ColorID:{test_color_id})"
-        with self.reader_lock:
-            self.received_log.append(simulated_message)
+        simulated_message = f"[{log_time()}] [SIMULATION] Task 2 started with test parameters (R:{test_row}, C:{test_col}, ColorID:{test_color_id})"
+        self._append_received_log(simulated_message)
 
         return "Task 2 simulation with direct arm communication has been initiated."
 
@@ -129,8 +166,14 @@ class CarController:
 
     def stop_thread(self):
         self.stopped = True
-        if self.reader_thread.is_alive():
-            self.reader_thread.join()
+        if self.io_reactor:
+            self.io_reactor.unregister("car")
+            if self.owns_reactor:
+                self.io_reactor.stop()
+        if self.writer:
+            self.writer.stop()
+        if self.serial_port and hasattr(self.serial_port, "close"):
+            self.serial_port.close()
 
     def get_received_log(self):
         with self.reader_lock:
@@ -140,10 +183,17 @@ class CarController:
         return list(self.sent_log)
 
     def send_command(self, command_string):
-        with self.send_lock:
-            if not self.serial_port:
-                return
-            packet_to_send = f"##{command_string}\r\n"
-            log_message = f"[{time.strftime('%H:%M:%S')}] {command_string}"
-            self.sent_log.append(log_message)
-            self.serial_port.write_str(packet_to_send)
+        if not self.serial_port:
+            return
+        self.writer.send(f"##{command_string}\r\n", command_string)
+
+    def _on_sent(self, command_string, data):
+        log_message = f"[{log_time()}] {command_string}"
+        self.sent_log.append(log_message)
+        self._emit("car_sent_log", {"entry": log_message})
+
+    def get_serial_stats(self):
+        return {
+            "decoder": self.decoder.get_stats(),
+            "writer": self.writer.get_stats() if self.writer else None,
+        }
@@ -0,0 +1,153 @@
+# app/modules/detector_scheduler.py
+import threading
+import time
+import math
+
+
+class DetectorSchedule:
+    """Run policy and bookkeeping for a single detector.
+
+    - every_n:   run at most once every N frames (1 = every frame)
+    - rate_hz:   run at most this many times per second (None = unlimited)
+    - budget_ms: if one run takes longer than this, skip enough of the
+                 following frames that the average cost per frame stays
+                 within the budget (None = no budget)
+    """
+
+    def __init__(self, name, every_n=1, rate_hz=None, budget_ms=None):
+        self.name = name
+        self.every_n = every_n
+        self.rate_hz = rate_hz
+        self.budget_ms = budget_ms
+
+        self.frames_since_run = None
+        self.backoff_frames = 0
+        self.last_run_time = None
+        self.last_result = None
+        self.last_cost_ms = 0.0
+        self.runs = 0
+        self.skips = 0
+
+    def get_config(self):
+        return {
+            "every_n": self.every_n,
+            "rate_hz": self.rate_hz,
+            "budget_ms": self.budget_ms,
+        }
+
+    def get_stats(self):
+        total = self.runs + self.skips
+        return {
+            "runs": self.runs,
+            "skips": self.skips,
+            "run_ratio": round(self.runs / total, 3) if total else 0.0,
+            "last_cost_ms": round(self.last_cost_ms, 2),
+        }
+
+
+class DetectorScheduler:
+    def __init__(self, defaults):
+        self.lock = threading.Lock()
+        self.schedules = {
+            name: DetectorSchedule(name, **config) for name, config in defaults.items()
+        }
+
+    def should_run(self, name, now=None):
+        """Decides whether detector `name` runs on the current frame."""
+        schedule = self.schedules[name]
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            run = self._due(schedule, now)
+            if run:
+                schedule.frames_since_run = 0
+                schedule.runs += 1
+            else:
+                schedule.frames_since_run += 1
+                schedule.skips += 1
+        return run
+
+    def _due(self, schedule, now):
+        if schedule.frames_since_run is None or schedule.last_result is None:
+            return True
+        elapsed_frames = schedule.frames_since_run + 1
+        if elapsed_frames < schedule.every_n + schedule.backoff_frames:
+            return False
+        if schedule.rate_hz and now - schedule.last_run_time < 1.0 / schedule.rate_hz:
+            return False
+        return True
+
+    def record(self, name, result, started, finished=None):
+        """Stores a fresh detector result and returns it with an age stamp."""
+        schedule = self.schedules[name]
+        if finished is None:
+            finished = time.monotonic()
+        cost_ms = (finished - started) * 1000
+        with self.lock:
+            schedule.last_cost_ms = cost_ms
+            schedule.last_run_time = finished
+            schedule.last_result = result
+            if schedule.budget_ms and cost_ms > schedule.budget_ms:
+                schedule.backoff_frames = math.ceil(cost_ms / schedule.budget_ms) - 1
+            else:
+                schedule.backoff_frames = 0
+        return dict(result, age_ms=0, stale=False)
+
+    def carry_forward(self, name, now=None):
+        """Returns the last result of a skipped detector, stamped with its age."""
+        schedule = self.schedules[name]
+        if now is None:
+            now = time.monotonic()
+        last_result, last_run_time = schedule.last_result, schedule.last_run_time
+        if last_result is None:
+            return {"detected": False}
+        age_ms = int((now - last_run_time) * 1000)
+        return dict(last_result, age_ms=age_ms, stale=True)
+
+    def set_schedule(self, name, **changes):
+        """Applies all `changes` together, or none of them if any is invalid."""
+        schedule = self.schedules.get(name)
+        if not schedule:
+            return False, f"Unknown detector: {name}"
+        # 先校验所有字段, 全部合法后再一起生效, 避免出错时留下一半的修改
+        config = {}
+        try:
+            if changes.get("every_n") is not None:
+                config["every_n"] = int(changes["every_n"])
+                if config["every_n"] < 1:
+                    return False, "every_n must be >= 1"
+            for key in ("rate_hz", "budget_ms"):
+                if key not in changes:
+                    continue
+                value = changes[key]
+                if value is not None:
+                    value = float(value)
+                    if not value > 0:
+                        return False, f"{key} must be > 0"
+                config[key] = value
+        except (TypeError, ValueError) as e:
+            return False, f"Invalid schedule value: {e}"
+        with self.lock:
+            if "budget_ms" in config and config["budget_ms"] != schedule.budget_ms:
+                schedule.backoff_frames = 0
+            for key, value in config.items():
+                setattr(schedule, key, value)
+        return True, f"Schedule for {name} set to {schedule.get_config()}"
+
+    def reset(self):
+        """Forgets past runs and results (e.g. before switching to another clock)."""
+        with self.lock:
+            for schedule in self.schedules.values():
+                schedule.frames_since_run = None
+                schedule.backoff_frames = 0
+                schedule.last_run_time = None
+                schedule.last_result = None
+                schedule.runs = 0
+                schedule.skips = 0
+
+    def get_config(self):
+        with self.lock:
+            return {name: s.get_config() for name, s in self.schedules.items()}
+
+    def get_stats(self):
+        return {name: s.get_stats() for name, s in self.schedules.items()}
@@ -0,0 +1,144 @@
+# app/modules/events.py
+import threading
+import json
+
+from .pipeline import DropOldestQueue
+
+SSE_KEEPALIVE_INTERVAL = 15.0
+# 检测结果中每帧都会变化、但不代表内容变化的字段
+# ("filtered" 是滤波器的浮点估计, 目标不动时也会有微小变化)
+_VOLATILE_DETECTION_KEYS = ("age_ms", "stale", "filtered")
+
+
+def format_sse(event_type, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event_type}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class EventHub:
+    """Fan-out of Server-Sent Events to every /api/events subscriber.
+
+    Each event is serialized once and shared by all subscribers. Every
+    subscriber has its own bounded drop-oldest queue, so a stalled browser
+    tab cannot block publishers or other tabs.
+    """
+
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.published = 0
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def publish(self, event_type, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        chunk = format_sse(event_type, data)
+        for queue in subscribers:
+            queue.put(chunk)
+        self.published += 1
+
+    def subscribe(self, initial_events=()):
+        queue = DropOldestQueue(self.queue_size)
+        for event_type, data in initial_events:
+            queue.put(format_sse(event_type, data))
+        with self.lock:
+            self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers.discard(queue)
+
+    def stream(self, queue):
+        """Generator for one SSE response; sends a comment line as keepalive."""
+        while not self.stopped:
+            chunk = queue.get(timeout=SSE_KEEPALIVE_INTERVAL)
+            if chunk is None:
+                yield b": keepalive\n\n"
+                continue
+            yield chunk
+
+    def get_stats(self):
+        return {"subscribers": len(self.subscribers), "published": self.published}
+
+
+class StatusPublisher:
+    """Publishes detection and system-state changes to an EventHub.
+
+    Wakes on every new detection snapshot (or at least every `poll_interval`
+    seconds) and only publishes what actually changed since the last event.
+    """
+
+    def __init__(
+        self, hub, vision_processor, state_manager, arm_controller, poll_interval=0.5
+    ):
+        self.hub = hub
+        self.vision_processor = vision_processor
+        self.state_manager = state_manager
+        self.arm_controller = arm_controller
+        self.poll_interval = poll_interval
+        self._last_detection = None
+        self._last_state = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def _detection_event(self, snapshot):
+        return dict(snapshot.data, seq=snapshot.seq, timestamp=snapshot.timestamp)
+
+    def _state_event(self):
+        state = dict(self.state_manager)
+        state["arm_vision_stream"] = self.arm_controller.get_vision_stream_status()[
+            "is_active"
+        ]
+        return state
+
+    def initial_events(self):
+        """Current detection and state, sent to a subscriber when it connects."""
+        return [
+            (
+                "detection",
+                self._detection_event(self.vision_processor.get_latest_snapshot()),
+            ),
+            ("state", self._state_event()),
+        ]
+
+    def _run(self):
+        last_seq = 0
+        while not self.stopped:
+            snapshot = self.vision_processor.wait_for_snapshot(
+                last_seq, timeout=self.poll_interval
+            )
+            if snapshot is not None:
+                last_seq = snapshot.seq
+                comparable = _strip_volatile(snapshot.data)
+                if comparable != self._last_detection:
+                    self._last_detection = comparable
+                    self.hub.publish("detection", self._detection_event(snapshot))
+
+            state = self._state_event()
+            if state != self._last_state:
+                self._last_state = state
+                self.hub.publish("state", state)
+
+
+def _strip_volatile(data):
+    return {
+        key: (
+            {k: v for k, v in value.items() if k not in _VOLATILE_DETECTION_KEYS}
+            if isinstance(value, dict)
+            else value
+        )
+        for key, value in data.items()
+    }
@@ -0,0 +1,147 @@
+# app/modules/frame_ring.py
+import json
+import os
+import threading
+from array import array
+
+
+class FrameRing:
+    """The last `capacity` encoded frames with their detection snapshots.
+
+    All memory is allocated up front: one bytearray split into fixed-size
+    JPEG slots plus flat arrays for timestamps, sequence numbers and
+    lengths, so `put()` is a slot copy with no per-frame allocation.
+    Frames larger than `slot_size` are counted and skipped. Entries are
+    kept in capture order, so lookups by timestamp are a binary search.
+    """
+
+    def __init__(self, capacity, slot_size=64 * 1024):
+        self.capacity = int(capacity)
+        self.slot_size = int(slot_size)
+        self.buffer = bytearray(self.capacity * self.slot_size)
+        self.view = memoryview(self.buffer)
+        self.timestamps = array("d", [0.0]) * self.capacity
+        self.seqs = array("q", [0]) * self.capacity
+        self.lengths = array("l", [0]) * self.capacity
+        # 快照本身不可修改，这里只保存引用
+        self.snapshots = [None] * self.capacity
+        self.next_slot = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.oversize = 0
+
+    def put(self, jpeg, timestamp, seq, snapshot=None):
+        size = len(jpeg)
+        if size > self.slot_size:
+            self.oversize += 1
+            return False
+        with self.lock:
+            slot = self.next_slot
+            offset = slot * self.slot_size
+            self.view[offset : offset + size] = jpeg
+            self.lengths[slot] = size
+            self.timestamps[slot] = timestamp
+            self.seqs[slot] = seq
+            self.snapshots[slot] = snapshot
+            self.next_slot = (slot + 1) % self.capacity
+            if self.count < self.capacity:
+                self.count += 1
+            self.stored += 1
+        return True
+
+    def _slot(self, index):
+        """Physical slot of the `index`-th oldest entry (0 = oldest)."""
+        return (self.next_slot - self.count + index) % self.capacity
+
+    def _entry(self, slot):
+        offset = slot * self.slot_size
+        return {
+            "timestamp": self.timestamps[slot],
+            "seq": self.seqs[slot],
+            "jpeg": bytes(self.view[offset : offset + self.lengths[slot]]),
+            "snapshot": self.snapshots[slot],
+        }
+
+    def _bisect(self, timestamp, keys=None):
+        """Index of the first entry captured at or after `timestamp`.
+
+        `keys` may be `self.seqs` to search by frame seq instead; both grow
+        in capture order.
+        """
+        keys = self.timestamps if keys is None else keys
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[self._slot(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def nearest(self, timestamp):
+        """The entry captured closest to `timestamp`, or None if empty."""
+        with self.lock:
+            if not self.count:
+                return None
+            i = self._bisect(timestamp)
+            candidates = [j for j in (i - 1, i) if 0 <= j < self.count]
+            best = min(
+                candidates,
+                key=lambda j: abs(self.timestamps[self._slot(j)] - timestamp),
+            )
+            return self._entry(self._slot(best))
+
+    def get(self, seq):
+        """The entry with frame seq `seq`, or None if it is no longer held."""
+        with self.lock:
+            i = self._bisect(seq, self.seqs)
+            if i < self.count and self.seqs[self._slot(i)] == seq:
+                return self._entry(self._slot(i))
+            return None
+
+    def window(self, start, end):
+        """Entries captured in [start, end], oldest first."""
+        with self.lock:
+            i = self._bisect(start)
+            entries = []
+            while i < self.count:
+                slot = self._slot(i)
+                if self.timestamps[slot] > end:
+                    break
+                entries.append(self._entry(slot))
+                i += 1
+            return entries
+
+    def get_stats(self):
+        with self.lock:
+            oldest = self.timestamps[self._slot(0)] if self.count else None
+            newest = self.timestamps[self._slot(self.count - 1)] if self.count else None
+        return {
+            "capacity": self.capacity,
+            "slot_size": self.slot_size,
+            "frames": self.count,
+            "stored": self.stored,
+            "oversize_skipped": self.oversize,
+            "oldest": oldest,
+            "newest": newest,
+        }
+
+
+def dump_entries(entries, directory):
+    """Writes entries as frame_NNNN.jpg plus an index.jsonl of their metadata."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "index.jsonl"), "w", encoding="utf-8") as index:
+        for i, entry in enumerate(entries):
+            name = f"frame_{i:04d}.jpg"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(entry["jpeg"])
+            snapshot = entry["snapshot"]
+            record = {
+                "file": name,
+                "timestamp": entry["timestamp"],
+                "seq": entry["seq"],
+                "detection": snapshot.data if snapshot else None,
+            }
+            index.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return len(entries)
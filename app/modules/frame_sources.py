@@ -0,0 +1,176 @@
+# app/modules/frame_sources.py
+import os
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+RAW_EXTENSIONS = (".raw", ".rgb", ".rgb888")
+
+
+class FrameSource:
+    """Recorded frames that the mock camera replays instead of drawing.
+
+    Every source hands out (height, width, 3) uint8 RGB arrays that are
+    already decoded and sized for the camera, so `frame(i)` is only an index
+    into memory and never the bottleneck of a run.
+    """
+
+    name = "recorded"
+
+    def __init__(self, frames, loop=True):
+        self.frames = frames
+        self.loop = loop
+        self.position = 0
+        self.served = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def next_frame(self):
+        """Returns the next frame, or None once a non-looping source ends."""
+        if self.position >= len(self.frames):
+            if not self.loop or not len(self.frames):
+                return None
+            self.position = 0
+        frame = self.frames[self.position]
+        self.position += 1
+        self.served += 1
+        return frame
+
+    def describe(self):
+        return {
+            "source": self.name,
+            "frames": len(self),
+            "position": self.position,
+            "served": self.served,
+            "loop": self.loop,
+        }
+
+
+def _fit(img, width, height):
+    img = img.convert("RGB")
+    if img.size != (width, height):
+        img = img.resize((width, height))
+    return np.asarray(img, dtype=np.uint8)
+
+
+class ImageSequenceSource(FrameSource):
+    """A directory of JPEG/PNG stills, decoded once into one array."""
+
+    name = "images"
+
+    def __init__(self, directory, width, height, loop=True, max_frames=None):
+        names = sorted(
+            n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS)
+        )[:max_frames]
+        if not names:
+            raise ValueError(f"No images found in {directory}")
+        frames = np.empty((len(names), height, width, 3), dtype=np.uint8)
+        for i, name in enumerate(names):
+            with Image.open(os.path.join(directory, name)) as img:
+                frames[i] = _fit(img, width, height)
+        super().__init__(frames, loop)
+        self.path = directory
+
+
+class RawDumpSource(FrameSource):
+    """Back-to-back RGB888 frames in one file, memory-mapped rather than read.
+
+    This is the format `save_raw_dump` writes, so a long recording only has
+    to be decoded once and every later run starts instantly.
+    """
+
+    name = "raw"
+
+    def __init__(self, path, width, height, loop=True):
+        frame_size = width * height * 3
+        size = os.path.getsize(path)
+        if size < frame_size or size % frame_size:
+            raise ValueError(
+                f"{path} is {size} bytes, not a whole number of "
+                f"{width}x{height} RGB888 frames"
+            )
+        frames = np.memmap(
+            path, dtype=np.uint8, mode="r", shape=(size // frame_size, height, width, 3)
+        )
+        super().__init__(frames, loop)
+        self.path = path
+
+
+class VideoSource(FrameSource):
+    """A video file decoded ahead of time with OpenCV (optional dependency)."""
+
+    name = "video"
+
+    def __init__(self, path, width, height, loop=True, max_frames=None):
+        try:
+            import cv2
+        except ImportError:
+            raise RuntimeError(
+                "Replaying a video file requires opencv-python; "
+                "convert it to a JPEG directory or raw dump instead"
+            )
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video {path}")
+        frames = []
+        try:
+            while max_frames is None or len(frames) < max_frames:
+                ok, bgr = capture.read()
+                if not ok:
+                    break
+                if bgr.shape[1] != width or bgr.shape[0] != height:
+                    bgr = cv2.resize(bgr, (width, height))
+                frames.append(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+        finally:
+            capture.release()
+        if not frames:
+            raise ValueError(f"No frames decoded from {path}")
+        super().__init__(np.stack(frames), loop)
+        self.path = path
+
+
+def open_frame_source(path, width, height, loop=True, max_frames=None):
+    """Picks the source type from the path: directory, raw dump or video."""
+    if os.path.isdir(path):
+        return ImageSequenceSource(path, width, height, loop, max_frames)
+    if path.lower().endswith(RAW_EXTENSIONS):
+        return RawDumpSource(path, width, height, loop)
+    return VideoSource(path, width, height, loop, max_frames)
+
+
+def save_raw_dump(source, path):
+    """Writes every frame of `source` to `path` in the RawDumpSource format."""
+    with open(path, "wb") as f:
+        for frame in source.frames:
+            f.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+    return len(source)
+
+
+def frame_source_from_env(width, height):
+    """Builds the mock camera's source from MOCK_CAMERA_* environment variables.
+
+    MOCK_CAMERA_SOURCE   path to a JPEG directory, raw dump or video
+                         (unset: the synthetic moving-target scene)
+    MOCK_CAMERA_LOOP     "0" stops after the last frame instead of looping
+    MOCK_CAMERA_MAX_FRAMES  only load the first N frames
+    """
+    path = os.environ.get("MOCK_CAMERA_SOURCE")
+    if not path:
+        return None
+    max_frames = os.environ.get("MOCK_CAMERA_MAX_FRAMES")
+    return open_frame_source(
+        path,
+        width,
+        height,
+        loop=os.environ.get("MOCK_CAMERA_LOOP", "1") != "0",
+        max_frames=int(max_frames) if max_frames else None,
+    )
+
+
+def camera_fps_from_env(default=30):
+    """MOCK_CAMERA_RATE=fast replays unthrottled; otherwise MOCK_CAMERA_FPS (real time)."""
+    if os.environ.get("MOCK_CAMERA_RATE", "realtime") == "fast":
+        return 0
+    return float(os.environ.get("MOCK_CAMERA_FPS", default))
@@ -1,17 +1,27 @@
 # app/modules/maix_mock.py
+import io
+import os
+import select
 import numpy as np
 from PIL import Image, ImageDraw
 import time
 import math
-import collections
 import threading
 import struct
 
+from .frame_sources import frame_source_from_env, camera_fps_from_env
+
 
-# ... (MockBlob, MockAprilTag, MockImage, MockCamera 的代码无变化) ...
 class MockBlob:
-    def __init__(self, x, y, w, h):
+    def __init__(self, x, y, w, h, code=1, pixels=None, rect=None, corners=None):
         self._cx, self._cy, self._w, self._h = x, y, w, h
+        self._code = code
+        self._pixels = pixels if pixels is not None else w * h
+        self._rect = rect or (x - w // 2, y - h // 2, w, h)
+        self._corners = corners
+
+    def code(self):
+        return self._code
 
     def cx(self):
         return self._cx
@@ -19,16 +29,30 @@ class MockBlob:
     def cy(self):
         return self._cy
 
+    def x(self):
+        return self._rect[0]
+
+    def y(self):
+        return self._rect[1]
+
     def w(self):
         return self._w
 
     def h(self):
         return self._h
 
+    def rect(self):
+        return self._rect
+
+    def pixels(self):
+        return self._pixels
+
     def area(self):
         return self._w * self._h
 
     def mini_corners(self):
+        if self._corners is not None:
+            return self._corners
         return [
             (self._cx - self._w // 2, self._cy - self._h // 2),
             (self._cx + self._w // 2, self._cy - self._h // 2),
@@ -37,6 +61,306 @@ class MockBlob:
         ]
 
 
+# --- NumPy 色块检测引擎：与设备上的 find_blobs 一样真正处理像素 ---
+_LAB_LUT = None
+
+
+def _rgb565_lab_lut():
+    """(65536, 3) int8 LUT from an RGB565 pixel to OpenMV-style L, A, B.
+
+    Like the firmware, pixels are reduced to RGB565 first and converted
+    through a table, so per-frame cost is one gather instead of the float
+    colour-space maths.
+    """
+    global _LAB_LUT
+    if _LAB_LUT is None:
+        idx = np.arange(65536)
+        r = ((idx >> 11) & 0x1F) * 255 // 31
+        g = ((idx >> 5) & 0x3F) * 255 // 63
+        b = (idx & 0x1F) * 255 // 31
+        rgb = np.stack([r, g, b], axis=1) / 255.0
+        lin = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+        m = np.array(
+            [
+                [0.4124, 0.3576, 0.1805],
+                [0.2126, 0.7152, 0.0722],
+                [0.0193, 0.1192, 0.9505],
+            ]
+        )
+        xyz = lin @ m.T / np.array([0.95047, 1.0, 1.08883])
+        f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+        lab = np.stack(
+            [
+                116 * f[:, 1] - 16,
+                500 * (f[:, 0] - f[:, 1]),
+                200 * (f[:, 1] - f[:, 2]),
+            ],
+            axis=1,
+        )
+        _LAB_LUT = np.clip(np.round(lab), -128, 127).astype(np.int8)
+    return _LAB_LUT
+
+
+def rgb_to_lab(rgb):
+    """Vectorized (H, W, 3) uint8 RGB -> (L, A, B) int16 planes."""
+    rgb = rgb.astype(np.uint16)
+    idx = ((rgb[..., 0] >> 3) << 11) | ((rgb[..., 1] >> 2) << 5) | (rgb[..., 2] >> 3)
+    lab = _rgb565_lab_lut()[idx].astype(np.int16)
+    return lab[..., 0], lab[..., 1], lab[..., 2]
+
+
+def _threshold_mask(l, a, b, threshold, invert=False):
+    l_lo, l_hi, a_lo, a_hi, b_lo, b_hi = threshold
+    mask = (
+        (l >= min(l_lo, l_hi))
+        & (l <= max(l_lo, l_hi))
+        & (a >= min(a_lo, a_hi))
+        & (a <= max(a_lo, a_hi))
+        & (b >= min(b_lo, b_hi))
+        & (b <= max(b_lo, b_hi))
+    )
+    return ~mask if invert else mask
+
+
+def _label_runs(mask):
+    """Connected-component labelling of a boolean mask via horizontal runs.
+
+    Returns (rows, x0, x1, labels) where each run covers columns [x0, x1) of
+    `rows` and `labels` are compact component ids (4-connectivity).
+    """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    d = np.diff(padded, axis=1)
+    rows, x0 = np.nonzero(d == 1)
+    _, x1 = np.nonzero(d == -1)
+    n = len(rows)
+    if n == 0:
+        return rows, x0, x1, np.zeros(0, dtype=np.int64)
+
+    # 相邻两行中在x方向上重叠的线段属于同一连通域
+    stride = width + 1
+    start_keys = rows * stride + x0
+    end_keys = rows * stride + x1
+    next_base = (rows + 1) * stride
+    lo = np.searchsorted(end_keys, next_base + x0, side="right")
+    hi = np.searchsorted(start_keys, next_base + x1, side="left")
+    counts = np.maximum(hi - lo, 0)
+    src = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    dst = np.repeat(lo, counts) + offsets
+
+    labels = np.arange(n)
+    while len(src):
+        m = np.minimum(labels[src], labels[dst])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, src, m)
+        np.minimum.at(new_labels, dst, m)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    _, labels = np.unique(labels, return_inverse=True)
+    return rows, x0, x1, labels
+
+
+def _convex_hull(points):
+    """Monotone-chain convex hull of an (N, 2) array, counter-clockwise."""
+    pts = np.unique(points, axis=0)
+    if len(pts) <= 2:
+        return pts
+
+    def half(seq):
+        hull = []
+        for p in seq:
+            while len(hull) >= 2:
+                (ox, oy), (ax, ay) = hull[-2], hull[-1]
+                if (ax - ox) * (p[1] - oy) - (ay - oy) * (p[0] - ox) > 0:
+                    break
+                hull.pop()
+            hull.append((p[0], p[1]))
+        return hull
+
+    lower = half(pts)
+    upper = half(pts[::-1])
+    return np.array(lower[:-1] + upper[:-1], dtype=np.float64)
+
+
+def min_area_rect_corners(points):
+    """Corners of the minimum-area rectangle enclosing `points` (rotating calipers)."""
+    hull = _convex_hull(np.asarray(points, dtype=np.float64))
+    if len(hull) < 3:
+        xs, ys = hull[:, 0], hull[:, 1]
+        x0, y0, x1, y1 = xs.min(), ys.min(), xs.max(), ys.max()
+        return [
+            (int(x0), int(y0)),
+            (int(x1), int(y0)),
+            (int(x1), int(y1)),
+            (int(x0), int(y1)),
+        ]
+    edges = np.roll(hull, -1, axis=0) - hull
+    angles = np.unique(np.mod(np.arctan2(edges[:, 1], edges[:, 0]), np.pi / 2))
+    cos, sin = np.cos(angles), np.sin(angles)
+    # 每个候选角度下把凸包旋转到轴对齐，取面积最小者
+    rx = hull[:, 0][None, :] * cos[:, None] + hull[:, 1][None, :] * sin[:, None]
+    ry = -hull[:, 0][None, :] * sin[:, None] + hull[:, 1][None, :] * cos[:, None]
+    areas = (rx.max(1) - rx.min(1)) * (ry.max(1) - ry.min(1))
+    i = int(np.argmin(areas))
+    c, s = cos[i], sin[i]
+    corners = []
+    for u, v in (
+        (rx[i].min(), ry[i].min()),
+        (rx[i].max(), ry[i].min()),
+        (rx[i].max(), ry[i].max()),
+        (rx[i].min(), ry[i].max()),
+    ):
+        corners.append((int(round(u * c - v * s)), int(round(u * s + v * c))))
+    return corners
+
+
+class _BlobAccumulator:
+    def __init__(self, code, pixels, sum_x, sum_y, x0, y0, x1, y1, points):
+        self.code = code
+        self.pixels = pixels
+        self.sum_x, self.sum_y = sum_x, sum_y
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.points = points
+
+    def overlaps(self, other, margin):
+        return (
+            self.x0 - margin <= other.x1
+            and other.x0 - margin <= self.x1
+            and self.y0 - margin <= other.y1
+            and other.y0 - margin <= self.y1
+        )
+
+    def absorb(self, other):
+        self.code |= other.code
+        self.pixels += other.pixels
+        self.sum_x += other.sum_x
+        self.sum_y += other.sum_y
+        self.x0, self.y0 = min(self.x0, other.x0), min(self.y0, other.y0)
+        self.x1, self.y1 = max(self.x1, other.x1), max(self.y1, other.y1)
+        self.points = np.concatenate([self.points, other.points])
+
+    def to_blob(self):
+        w, h = self.x1 - self.x0 + 1, self.y1 - self.y0 + 1
+        return MockBlob(
+            int(self.sum_x / self.pixels),
+            int(self.sum_y / self.pixels),
+            int(w),
+            int(h),
+            code=self.code,
+            pixels=int(self.pixels),
+            rect=(int(self.x0), int(self.y0), int(w), int(h)),
+            corners=min_area_rect_corners(self.points),
+        )
+
+
+def _components(mask, code, off_x, off_y, pixels_threshold, area_threshold):
+    rows, x0, x1, labels = _label_runs(mask)
+    if len(rows) == 0:
+        return []
+    count = labels.max() + 1
+    lengths = x1 - x0
+    rows_abs, x0_abs, x1_abs = rows + off_y, x0 + off_x, x1 + off_x - 1
+    pixels = np.bincount(labels, weights=lengths, minlength=count)
+    sum_x = np.bincount(
+        labels, weights=(x0_abs + x1_abs) * lengths / 2.0, minlength=count
+    )
+    sum_y = np.bincount(labels, weights=rows_abs * lengths, minlength=count)
+    bx0 = np.full(count, np.iinfo(np.int64).max)
+    by0 = np.full(count, np.iinfo(np.int64).max)
+    bx1 = np.full(count, -1)
+    by1 = np.full(count, -1)
+    np.minimum.at(bx0, labels, x0_abs)
+    np.minimum.at(by0, labels, rows_abs)
+    np.maximum.at(bx1, labels, x1_abs)
+    np.maximum.at(by1, labels, rows_abs)
+
+    # 先按像素数/面积整体过滤，噪声产生的大量小连通域不进入逐个处理的循环
+    areas = (bx1 - bx0 + 1) * (by1 - by0 + 1)
+    keep = (pixels >= pixels_threshold) & (areas >= area_threshold)
+    order = np.argsort(labels, kind="stable")
+    splits = np.cumsum(np.bincount(labels, minlength=count))[:-1]
+    run_groups = np.split(order, splits)
+    blobs = []
+    for i in np.flatnonzero(keep):
+        runs = run_groups[i]
+        # 用每段的两个端点(含像素外沿)作为最小外接矩形的候选点
+        xs0, xs1, ys = x0_abs[runs], x1_abs[runs] + 1, rows_abs[runs]
+        points = np.concatenate(
+            [
+                np.stack([xs0, ys], 1),
+                np.stack([xs1, ys], 1),
+                np.stack([xs0, ys + 1], 1),
+                np.stack([xs1, ys + 1], 1),
+            ]
+        )
+        blobs.append(
+            _BlobAccumulator(
+                code,
+                pixels[i],
+                sum_x[i],
+                sum_y[i],
+                bx0[i],
+                by0[i],
+                bx1[i],
+                by1[i],
+                points,
+            )
+        )
+    return blobs
+
+
+def find_blobs_numpy(
+    rgb,
+    thresholds,
+    invert=False,
+    roi=None,
+    area_threshold=10,
+    pixels_threshold=10,
+    merge=False,
+    margin=0,
+):
+    """NumPy implementation of `image.find_blobs` for the mock backend.
+
+    LAB conversion happens once per call however many thresholds are given;
+    each threshold then costs one vectorized compare plus labelling.
+    """
+    off_x = off_y = 0
+    if roi:
+        rx, ry, rw, rh = (int(v) for v in roi)
+        rgb = rgb[max(ry, 0) : ry + rh, max(rx, 0) : rx + rw]
+        off_x, off_y = max(rx, 0), max(ry, 0)
+    if rgb.size == 0:
+        return []
+    l, a, b = rgb_to_lab(rgb)
+
+    accumulators = []
+    for i, threshold in enumerate(thresholds):
+        mask = _threshold_mask(l, a, b, threshold, invert)
+        accumulators.extend(
+            _components(mask, 1 << i, off_x, off_y, pixels_threshold, area_threshold)
+        )
+
+    if merge:
+        merged = True
+        while merged:
+            merged = False
+            result = []
+            for acc in accumulators:
+                for other in result:
+                    if other.overlaps(acc, margin):
+                        other.absorb(acc)
+                        merged = True
+                        break
+                else:
+                    result.append(acc)
+            accumulators = result
+    return [acc.to_blob() for acc in accumulators]
+
+
 class MockAprilTag:
     def __init__(self, tag_id, x, y, corners):
         self._id, self._cx, self._cy, self._corners = tag_id, x, y, corners
@@ -57,20 +381,60 @@ class MockAprilTag:
         return -0.5
 
 
+class MockQRCode:
+    def __init__(self, x, y, size, payload):
+        self._x, self._y, self._size, self._payload = x, y, size, payload
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def corners(self):
+        x, y, s = self._x, self._y, self._size
+        return [(x, y), (x + s, y), (x + s, y + s), (x, y + s)]
+
+    def payload(self):
+        return self._payload
+
+
+# 合成画面右下角固定放着一个样本管二维码 (静止场景)
+MOCK_QR_RECT = (260, 180, 40)
+MOCK_QR_PAYLOAD = '{"编号": "ORG-2025-0001"}'
+
+
+# 模拟色块使用的RGB值，各自落在 vision.COLOR_THRESHOLDS 对应的LAB范围内
+MOCK_BLOB_RGB = {
+    "blue": (0, 100, 160),
+    "yellow": (150, 120, 0),
+    "orange": (190, 60, 0),
+    "purple": (100, 100, 220),
+}
+
+
 class MockImage:
-    def __init__(self, width, height):
+    def __init__(self, width, height, pixels=None):
         self.width, self.height = width, height
-        self.img = Image.new("RGB", (width, height), color="darkgray")
+        if pixels is None:
+            self.img = Image.new("RGB", (width, height), color="darkgray")
+        else:
+            # 回放的帧: Image.fromarray 会复制像素，叠加绘制不会改动源数据
+            self.img = Image.fromarray(np.asarray(pixels), "RGB")
+        # 只有合成画面里才有模拟的 AprilTag
+        self.synthetic = pixels is None
         self.draw = ImageDraw.Draw(self.img)
         self.COLOR_GREEN, self.COLOR_RED = "green", "red"
         self.ApriltagFamilies = type("Families", (), {"TAG36H11": "TAG36H11"})
         self.blob_center = (width / 2, height / 2)
         self.tag_center = (width / 4, height / 4)
-        self.mock_blob_color_cycle = ["blue", "yellow", "orange", "purple"]
+        self.mock_blob_color_cycle = list(MOCK_BLOB_RGB)
         self.current_mock_color = "blue"
 
-    def _update_object_positions(self):
-        t = time.time()
+    def _update_object_positions(self, t=None):
+        # 传入固定的 t 可以得到可复现的画面 (基准测试使用)
+        if t is None:
+            t = time.time()
         self.blob_center = (
             self.width / 2 + math.sin(t * 0.8) * 50,
             self.height / 2 + math.cos(t * 0.8) * 50,
@@ -84,28 +448,43 @@ class MockImage:
         ]
         x, y = self.blob_center
         self.draw.ellipse(
-            (x - 15, y - 15, x + 15, y + 15), fill=self.current_mock_color
+            (x - 15, y - 15, x + 15, y + 15),
+            fill=MOCK_BLOB_RGB[self.current_mock_color],
         )
 
-    def find_blobs(self, thresholds, pixels_threshold=100, merge=True):
-        requested_color = "unknown"
-        first_thresh = thresholds[0][0]
-        if first_thresh == [0, 80, -10, 10, -55, -30]:
-            requested_color = "blue"
-        elif first_thresh == [0, 80, -15, 15, 50, 80]:
-            requested_color = "yellow"
-        elif first_thresh == [0, 80, 40, 60, 40, 80]:
-            requested_color = "orange"
-        elif first_thresh == [28, 68, 12, 52, -80, -40]:
-            requested_color = "purple"
-        if requested_color == self.current_mock_color:
-            return [
-                MockBlob(int(self.blob_center[0]), int(self.blob_center[1]), 30, 30)
-            ]
-        return []
+    def _in_roi(self, x, y, roi):
+        if not roi:
+            return True
+        rx, ry, rw, rh = roi
+        return rx <= x < rx + rw and ry <= y < ry + rh
+
+    def find_blobs(
+        self,
+        thresholds,
+        invert=False,
+        roi=None,
+        x_stride=2,
+        y_stride=1,
+        area_threshold=10,
+        pixels_threshold=10,
+        merge=False,
+        margin=0,
+    ):
+        return find_blobs_numpy(
+            np.asarray(self.img),
+            thresholds,
+            invert=invert,
+            roi=roi,
+            area_threshold=area_threshold,
+            pixels_threshold=pixels_threshold,
+            merge=merge,
+            margin=margin,
+        )
 
-    def find_apriltags(self, families=None):
+    def find_apriltags(self, families=None, roi=None):
         x, y = self.tag_center
+        if not self.synthetic or not self._in_roi(x, y, roi):
+            return []
         corners = [
             (x - 15, y - 15),
             (x + 15, y - 15),
@@ -114,10 +493,13 @@ class MockImage:
         ]
         return [MockAprilTag(18, int(x), int(y), corners)]
 
-    def find_qrcodes(self):
-        return []
+    def find_qrcodes(self, roi=None):
+        x, y, size = MOCK_QR_RECT
+        if not self.synthetic or not self._in_roi(x + size / 2, y + size / 2, roi):
+            return []
+        return [MockQRCode(x, y, size, MOCK_QR_PAYLOAD)]
 
-    def draw_line(self, x1, y1, x2, y2, color, thickness):
+    def draw_line(self, x1, y1, x2, y2, color, thickness=1):
         self.draw.line((x1, y1, x2, y2), fill=color, width=thickness)
 
     def draw_cross(self, x, y, color, size):
@@ -135,17 +517,67 @@ class MockImage:
         self.img.save(path, "JPEG", quality=quality)
         return 0
 
+    def copy(self):
+        copied = MockImage(self.width, self.height)
+        copied.img = self.img.copy()
+        copied.draw = ImageDraw.Draw(copied.img)
+        copied.synthetic = self.synthetic
+        copied.blob_center, copied.tag_center = self.blob_center, self.tag_center
+        return copied
+
+    def resize(self, width, height):
+        resized = MockImage(width, height)
+        resized.img = self.img.resize((width, height))
+        resized.draw = ImageDraw.Draw(resized.img)
+        return resized
+
+    def to_jpeg(self, quality=95):
+        buf = io.BytesIO()
+        self.img.save(buf, "JPEG", quality=quality)
+        return MockJpegImage(buf.getvalue())
+
+
+class MockJpegImage:
+    """Mirrors the JPEG-format image returned by maix `Image.to_jpeg()`."""
+
+    def __init__(self, data):
+        self._data = data
+
+    def to_bytes(self):
+        return self._data
+
 
 class MockCamera:
-    def __init__(self, width=320, height=240):
+    def __init__(self, width=320, height=240, fps=30, source=None):
         self.width, self.height = width, height
-        self.mock_image = MockImage(width, height)
-        print("--- [MOCK] Using MOCK MaixPy Camera ---")
+        # fps=0: 不限速，回放尽可能快 (用于基准测试)
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self._next_frame_time = 0.0
+        self.source = source
+        if source is None:
+            print("--- [MOCK] Using MOCK MaixPy Camera ---")
+        else:
+            print(
+                f"--- [MOCK] Using MOCK MaixPy Camera replaying {source.describe()} ---"
+            )
 
     def read(self):
-        self.mock_image.img.paste("darkgray", (0, 0, self.width, self.height))
-        self.mock_image._update_object_positions()
-        return self.mock_image
+        # 与真实摄像头一样按帧率阻塞，并且每次返回一张新的图像
+        if self.frame_interval:
+            now = time.monotonic()
+            if self._next_frame_time > now:
+                time.sleep(self._next_frame_time - now)
+            self._next_frame_time = (
+                max(now, self._next_frame_time) + self.frame_interval
+            )
+        if self.source is not None:
+            frame = self.source.next_frame()
+            if frame is None:
+                return None
+            return MockImage(self.width, self.height, pixels=frame)
+        mock_image = MockImage(self.width, self.height)
+        mock_image._update_object_positions()
+        return mock_image
 
     def close(self):
         print("--- [MOCK] MOCK MaixPy Camera closed. ---")
@@ -154,23 +586,39 @@ class MockCamera:
 class MockUART:
     def __init__(self, port, baudrate):
         self.port, self.baudrate = port, baudrate
-        self.read_buffer = collections.deque(maxlen=10)
+        # 用管道模拟接收缓冲区, 这样串口有真实的文件描述符, 可以被 select/epoll 等待
+        self._rx_r, self._rx_w = os.pipe()
+        os.set_blocking(self._rx_r, False)
         self.write_log = []
-        self.lock = threading.Lock()
         print(
             f"--- [MOCK] MOCK UART initialized on port {port} at {baudrate} baud. ---"
         )
 
-    def _add_to_read_buffer(self, message):
-        with self.lock:
-            print(f"--- [MOCK] Hardware on {self.port} sends: '{message}' ---")
-            self.read_buffer.append(message.encode("utf-8"))
+    def fileno(self):
+        return self._rx_r
 
-    def read(self):
-        with self.lock:
-            if self.read_buffer:
-                return self.read_buffer.popleft()
-        return None
+    def close(self):
+        if self._rx_r is None:
+            return
+        os.close(self._rx_r)
+        os.close(self._rx_w)
+        self._rx_r = self._rx_w = None
+
+    def _add_to_read_buffer(self, message):
+        print(f"--- [MOCK] Hardware on {self.port} sends: '{message}' ---")
+        os.write(self._rx_w, (message + "\r\n").encode("utf-8"))
+
+    def read(self, length=-1, timeout=0):
+        """Same signature as maix.uart.UART.read (timeout in ms, -1 = forever)."""
+        if timeout:
+            wait = None if timeout < 0 else timeout / 1000
+            ready, _, _ = select.select([self._rx_r], [], [], wait)
+            if not ready:
+                return None
+        try:
+            return os.read(self._rx_r, 4096 if length < 0 else length)
+        except BlockingIOError:
+            return None
 
     def write_str(self, s):
         command = s.strip()
@@ -253,7 +701,12 @@ class Maix:
         self.display = self
 
     def Camera(self, width, height):
-        return MockCamera(width, height)
+        return MockCamera(
+            width,
+            height,
+            fps=camera_fps_from_env(),
+            source=frame_source_from_env(width, height),
+        )
 
     def UART(self, port, baudrate):
         return MockUART(port, baudrate)
@@ -0,0 +1,32 @@
+# app/modules/overlay.py
+
+
+class OverlayRecorder:
+    """Records draw calls so they can be applied to a frame later, or not at all.
+
+    Detectors draw onto a recorder instead of the image itself. The vision
+    loop only replays the recorded calls when somebody will actually see the
+    frame (a stream client or the local display), and can replay a skipped
+    detector's last overlay so carried-forward results stay visible.
+    """
+
+    __slots__ = ("ops",)
+
+    def __init__(self):
+        self.ops = []
+
+    def draw_line(self, *args, **kwargs):
+        self.ops.append(("draw_line", args, kwargs))
+
+    def draw_cross(self, *args, **kwargs):
+        self.ops.append(("draw_cross", args, kwargs))
+
+    def draw_string(self, *args, **kwargs):
+        self.ops.append(("draw_string", args, kwargs))
+
+    def draw_rect(self, *args, **kwargs):
+        self.ops.append(("draw_rect", args, kwargs))
+
+    def apply(self, img):
+        for name, args, kwargs in self.ops:
+            getattr(img, name)(*args, **kwargs)
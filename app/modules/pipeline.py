@@ -0,0 +1,137 @@
+# app/modules/pipeline.py
+import threading
+import time
+import collections
+
+
+class DropOldestQueue:
+    """A small bounded queue joining two pipeline stages.
+
+    When the queue is full the oldest item is discarded so the consumer
+    always works on the freshest frame instead of a growing backlog.
+    """
+
+    def __init__(self, maxsize=2, depth_histogram=None):
+        self.maxsize = max(1, int(maxsize))
+        self.depth_histogram = depth_histogram
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the oldest queued item, or None if `timeout` expires."""
+        with self._cond:
+            if timeout is None:
+                while not self._items:
+                    self._cond.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self._items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+            if self.depth_histogram is not None:
+                self.depth_histogram.observe(len(self._items))
+            return self._items.popleft()
+
+    def qsize(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def get_stats(self):
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "put": self.put_count,
+            "dropped": self.dropped,
+        }
+
+
+class StageStats:
+    """Throughput and busy-time counters for one pipeline stage.
+
+    Each stage has a single writer thread, so no locking is needed; readers
+    only ever see slightly stale numbers.
+    """
+
+    def __init__(self, name, window=30, histogram=None):
+        self.name = name
+        self.histogram = histogram
+        self.frames = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+        self._stamps = collections.deque(maxlen=window)
+
+    def record(self, started, finished=None):
+        if finished is None:
+            finished = time.monotonic()
+        elapsed = finished - started
+        self.frames += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        self._stamps.append(finished)
+        if self.histogram is not None:
+            self.histogram.observe(elapsed)
+
+    def fps(self):
+        stamps = list(self._stamps)
+        if len(stamps) < 2:
+            return 0.0
+        span = stamps[-1] - stamps[0]
+        if span <= 0:
+            return 0.0
+        # 超过1秒没有新帧，视为该阶段已停顿
+        if time.monotonic() - stamps[-1] > 1.0:
+            return 0.0
+        return (len(stamps) - 1) / span
+
+    def get_stats(self):
+        avg = self.total_time / self.frames if self.frames else 0.0
+        return {
+            "frames": self.frames,
+            "fps": round(self.fps(), 2),
+            "avg_ms": round(avg * 1000, 2),
+            "last_ms": round(self.last_time * 1000, 2),
+        }
+
+
+class VersionedSlot:
+    """Holds the most recently published value and a sequence number.
+
+    Readers take `slot.value` with a single reference read and no lock;
+    published values must never be mutated afterwards. Consumers that want
+    the next value block in `wait_newer(seq)` instead of polling.
+    """
+
+    def __init__(self, value=None):
+        self.value = value
+        self.seq = 0
+        self._cond = threading.Condition()
+
+    def publish(self, value):
+        with self._cond:
+            self.seq += 1
+            self.value = value
+            self._cond.notify_all()
+            return self.seq
+
+    def wait_newer(self, seq, timeout=None):
+        """Returns the current value once its seq exceeds `seq`, or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq > seq, timeout):
+                return None
+            return self.value
@@ -0,0 +1,111 @@
+# app/modules/roi.py
+
+
+def bbox_from_corners(corners):
+    """Axis-aligned (x, y, w, h) bounding box of a list of corner points."""
+    xs = [int(p[0]) for p in corners]
+    ys = [int(p[1]) for p in corners]
+    return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+
+
+class TemporalROI:
+    """Restricts a detector's search window to the area around its last hit.
+
+    After a hit, the next search covers the last bounding box padded on every
+    side. The detector falls back to a full-frame search after `max_misses`
+    consecutive misses inside the window, and every `refresh_every` frames so
+    that new targets elsewhere in the frame are still picked up.
+    """
+
+    def __init__(
+        self,
+        frame_width,
+        frame_height,
+        padding_ratio=0.5,
+        min_padding=16,
+        max_misses=3,
+        refresh_every=30,
+    ):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.padding_ratio = padding_ratio
+        self.min_padding = min_padding
+        self.max_misses = max_misses
+        self.refresh_every = refresh_every
+        self.enabled = True
+
+        self.last_bbox = None
+        self.misses = 0
+        self.frames_since_full = 0
+
+        self.full_searches = 0
+        self.roi_searches = 0
+        self.roi_hits = 0
+        self.pixels_searched = 0
+
+    def reset(self):
+        self.last_bbox = None
+        self.misses = 0
+        self.frames_since_full = 0
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+        self.reset()
+        return self.enabled
+
+    def next_roi(self):
+        """Returns [x, y, w, h] for the next search, or None for the full frame."""
+        if (
+            not self.enabled
+            or self.last_bbox is None
+            or self.frames_since_full >= self.refresh_every
+        ):
+            return None
+        x, y, w, h = self.last_bbox
+        pad = max(self.min_padding, int(max(w, h) * self.padding_ratio))
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1 = min(self.frame_width, x + w + pad)
+        y1 = min(self.frame_height, y + h + pad)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return [x0, y0, x1 - x0, y1 - y0]
+
+    def update(self, roi, bbox):
+        """Records the outcome of a search made with `roi` (None = full frame)."""
+        if roi is None:
+            self.full_searches += 1
+            self.frames_since_full = 0
+            self.pixels_searched += self.frame_width * self.frame_height
+            self.last_bbox = bbox
+            self.misses = 0
+            return
+
+        self.roi_searches += 1
+        self.frames_since_full += 1
+        self.pixels_searched += roi[2] * roi[3]
+        if bbox is not None:
+            self.roi_hits += 1
+            self.last_bbox = bbox
+            self.misses = 0
+        else:
+            self.misses += 1
+            if self.misses >= self.max_misses:
+                self.reset()
+
+    def get_stats(self):
+        searches = self.full_searches + self.roi_searches
+        full_pixels = searches * self.frame_width * self.frame_height
+        return {
+            "enabled": self.enabled,
+            "full_searches": self.full_searches,
+            "roi_searches": self.roi_searches,
+            "roi_hit_rate": (
+                round(self.roi_hits / self.roi_searches, 3)
+                if self.roi_searches
+                else 0.0
+            ),
+            "pixels_saved_ratio": (
+                round(1 - self.pixels_searched / full_pixels, 3) if full_pixels else 0.0
+            ),
+            "current_roi": self.next_roi(),
+        }
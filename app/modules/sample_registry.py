@@ -0,0 +1,122 @@
+# app/modules/sample_registry.py
+import collections
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    code TEXT PRIMARY KEY,
+    info TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+class SampleRegistry:
+    """Sample information by 编号, stored in SQLite with a hot LRU cache in front.
+
+    Rows are only read on demand through the primary-key index, so startup
+    time and memory do not grow with the size of the biobank. Lookups that
+    miss the database fall back to `fallback` (the built-in ORGANS_INFO),
+    and misses are cached too, so a QR code that is not a sample ID costs
+    one query, not one per frame.
+    """
+
+    def __init__(self, path=None, fallback=None, cache_size=1024):
+        self.path = path
+        self.fallback = fallback or {}
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if path and os.path.exists(path):
+            try:
+                self.conn = sqlite3.connect(path, check_same_thread=False)
+                self.conn.execute(SCHEMA)
+                print(f"Sample registry opened: {path} ({self.count()} samples)")
+            except sqlite3.Error as e:
+                print(f"!!! Failed to open sample registry {path}: {e}")
+                self.conn = None
+
+    def get(self, code):
+        """Returns the info dict for `code`, or None. Callers must not modify it."""
+        with self.lock:
+            if code in self._cache:
+                self._cache.move_to_end(code)
+                self.hits += 1
+                return self._cache[code]
+            self.misses += 1
+            info = self._query(code)
+            self._cache[code] = info
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return info
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def _query(self, code):
+        if self.conn is not None:
+            try:
+                row = self.conn.execute(
+                    "SELECT info FROM samples WHERE code = ?", (code,)
+                ).fetchone()
+                if row:
+                    return json.loads(row[0])
+            except (sqlite3.Error, ValueError) as e:
+                print(f"!!! Sample registry lookup for {code} failed: {e}")
+        return self.fallback.get(code)
+
+    def count(self):
+        if self.conn is None:
+            return len(self.fallback)
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def get_stats(self):
+        return {
+            "backend": "sqlite" if self.conn is not None else "builtin",
+            "path": self.path,
+            "cache_size": len(self._cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+        }
+
+
+def import_samples(path, records, batch_size=5000):
+    """Bulk-inserts `records` (dicts with a 编号 key) into the registry at `path`.
+
+    Existing rows with the same 编号 are replaced. Returns the number of
+    records written. Runs as one transaction per batch, so importing tens of
+    thousands of rows takes seconds rather than minutes.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(SCHEMA)
+        written = 0
+        batch = []
+        for record in records:
+            code = record.get("编号")
+            if not code:
+                raise ValueError(f"Record without 编号: {record}")
+            batch.append((str(code), json.dumps(record, ensure_ascii=False)))
+            if len(batch) >= batch_size:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO samples (code, info) VALUES (?, ?)",
+                        batch,
+                    )
+                written += len(batch)
+                batch = []
+        if batch:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO samples (code, info) VALUES (?, ?)", batch
+                )
+            written += len(batch)
+        return written
+    finally:
+        conn.close()
@@ -0,0 +1,346 @@
+# app/modules/serial_io.py
+import collections
+import functools
+import os
+import selectors
+import threading
+import time
+
+from .metrics import (
+    SERIAL_BYTES_SENT,
+    SERIAL_ERRORS,
+    SERIAL_QUEUE_SECONDS,
+    SERIAL_SEND_SECONDS,
+    SERIAL_SUPERSEDED,
+    SERIAL_WAKE_SECONDS,
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _format_clock(second):
+    return time.strftime("%H:%M:%S", time.localtime(second))
+
+
+def log_time():
+    """`%H:%M:%S` of now for serial logs, formatted at most once per second."""
+    return _format_clock(int(time.time()))
+
+
+class _Port:
+    __slots__ = (
+        "name",
+        "port",
+        "handler",
+        "on_idle",
+        "idle_timeout",
+        "idle_deadline",
+        "wake_seconds",
+        "errors",
+        "thread",
+    )
+
+    def __init__(self, name, port, handler, on_idle=None, idle_timeout=0.02):
+        self.name = name
+        self.port = port
+        self.handler = handler
+        self.on_idle = on_idle
+        self.idle_timeout = idle_timeout
+        self.idle_deadline = None
+        self.wake_seconds = SERIAL_WAKE_SECONDS.labels(name)
+        self.errors = SERIAL_ERRORS.labels(name)
+        self.thread = None
+
+
+class SerialReactor:
+    """Services all UARTs of the app and hands received bytes to handlers.
+
+    Ports that expose `fileno()` are multiplexed with `selectors` (epoll on
+    Linux): one thread sleeps until any of them has data and dispatches it
+    immediately. A port without a file descriptor (the MaixPy UART) gets
+    a reader thread doing blocking reads with a timeout instead. There is
+    no polling interval in either case. `handler(data)` runs on the I/O
+    thread; on both paths the delay from `read()` returning to calling it
+    is recorded per port in SERIAL_WAKE_SECONDS. If `on_idle` is given it is called once
+    the port has been quiet for `idle_timeout` seconds after receiving
+    data (used to flush messages that have no terminator).
+    """
+
+    def __init__(self, read_timeout=0.5):
+        self.read_timeout = read_timeout
+        self.selector = selectors.DefaultSelector()
+        self.ports = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.started = False
+        self.thread = threading.Thread(target=self._select_loop, daemon=True)
+        # 自唤醒管道: 注册/停止时让 select() 立刻返回
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+    def register(self, name, port, handler, on_idle=None, idle_timeout=0.02):
+        entry = _Port(name, port, handler, on_idle, idle_timeout)
+        with self.lock:
+            if name in self.ports:
+                raise ValueError(f"Serial port {name} already registered")
+            self.ports[name] = entry
+            if self._fileno(port) is not None:
+                self.selector.register(self._fileno(port), selectors.EVENT_READ, entry)
+                self._wake()
+            elif self.started:
+                self._start_reader(entry)
+        return entry
+
+    def unregister(self, name):
+        with self.lock:
+            entry = self.ports.pop(name, None)
+            if entry is None:
+                return
+            if entry.thread is None:
+                try:
+                    self.selector.unregister(self._fileno(entry.port))
+                except (KeyError, ValueError):
+                    pass
+        if entry.thread is not None and entry.thread is not threading.current_thread():
+            entry.thread.join()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            for entry in self.ports.values():
+                if self._fileno(entry.port) is None:
+                    self._start_reader(entry)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self._wake()
+        for name in list(self.ports):
+            self.unregister(name)
+        if self.thread.is_alive():
+            self.thread.join()
+        # 线程已退出, 释放唤醒管道和 selector (epoll) 的文件描述符
+        with self.lock:
+            if self._wake_r is None:
+                return
+            try:
+                self.selector.unregister(self._wake_r)
+            except (KeyError, ValueError):
+                pass
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+            self.selector.close()
+
+    def _wake(self):
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"\0")
+
+    def _fileno(self, port):
+        fileno = getattr(port, "fileno", None)
+        if fileno is None:
+            return None
+        try:
+            return fileno()
+        except (OSError, ValueError):
+            return None
+
+    def _start_reader(self, entry):
+        entry.thread = threading.Thread(
+            target=self._blocking_read_loop, args=(entry,), daemon=True
+        )
+        entry.thread.start()
+
+    def _dispatch(self, entry, data, read_at):
+        entry.wake_seconds.observe(time.perf_counter() - read_at)
+        try:
+            entry.handler(data)
+        except Exception as e:
+            entry.errors.inc()
+            print(f"!!! Error handling data from {entry.name}: {e}")
+        if entry.on_idle is not None:
+            entry.idle_deadline = time.perf_counter() + entry.idle_timeout
+
+    def _fire_idle(self, entry):
+        entry.idle_deadline = None
+        try:
+            entry.on_idle()
+        except Exception as e:
+            entry.errors.inc()
+            print(f"!!! Error handling idle on {entry.name}: {e}")
+
+    def _select_timeout(self):
+        timeout = self.read_timeout
+        now = time.perf_counter()
+        for entry in list(self.ports.values()):
+            if entry.idle_deadline is not None:
+                timeout = min(timeout, max(entry.idle_deadline - now, 0.0))
+        return timeout
+
+    def _select_loop(self):
+        while not self.stopped:
+            events = self.selector.select(self._select_timeout())
+            for key, _ in events:
+                entry = key.data
+                if entry is None:
+                    try:
+                        os.read(self._wake_r, 512)
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    data = entry.port.read()
+                    read_at = time.perf_counter()
+                except Exception as e:
+                    entry.errors.inc()
+                    print(f"!!! Error reading {entry.name}: {e}")
+                    self._suspend(entry)
+                    continue
+                if data:
+                    self._dispatch(entry, data, read_at)
+            now = time.perf_counter()
+            for entry in list(self.ports.values()):
+                if entry.idle_deadline is not None and entry.idle_deadline <= now:
+                    self._fire_idle(entry)
+
+    def _suspend(self, entry, delay=1.0):
+        """Stops selecting a failing port for `delay` seconds."""
+        with self.lock:
+            try:
+                self.selector.unregister(self._fileno(entry.port))
+            except (KeyError, ValueError):
+                return
+
+        def resume():
+            with self.lock:
+                if self.ports.get(entry.name) is entry and not self.stopped:
+                    self.selector.register(
+                        self._fileno(entry.port), selectors.EVENT_READ, entry
+                    )
+                    self._wake()
+
+        timer = threading.Timer(delay, resume)
+        timer.daemon = True
+        timer.start()
+
+    def _blocking_read_loop(self, entry):
+        while not self.stopped and self.ports.get(entry.name) is entry:
+            timeout = self.read_timeout
+            if entry.idle_deadline is not None:
+                timeout = max(entry.idle_deadline - time.perf_counter(), 0.001)
+            try:
+                data = entry.port.read(-1, max(int(timeout * 1000), 1))
+                read_at = time.perf_counter()
+            except Exception as e:
+                entry.errors.inc()
+                print(f"!!! Error reading {entry.name}: {e}")
+                time.sleep(1)
+                continue
+            if data:
+                self._dispatch(entry, data, read_at)
+            elif entry.idle_deadline is not None:
+                self._fire_idle(entry)
+
+
+class SerialWriter:
+    """Owns all writes to one UART through a queue and a writer thread.
+
+    `send()` only enqueues, so Flask request threads and the vision stream
+    never block on serial I/O. Commands (`key=None`) are sent first, in
+    order. Telemetry is queued by `key` (the packet type): a newer packet
+    of the same type replaces one still waiting, so the link never
+    carries stale offsets. `on_sent(log_message, data)` runs on the writer
+    thread after each write, for logging.
+    """
+
+    def __init__(self, name, port, on_sent=None):
+        self.name = name
+        self.port = port
+        self.on_sent = on_sent
+        self.commands = collections.deque()
+        self.telemetry = collections.OrderedDict()
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.sent = 0
+        self.superseded = 0
+        self._send_seconds = SERIAL_SEND_SECONDS.labels(name)
+        self._bytes_sent = SERIAL_BYTES_SENT.labels(name)
+        self._errors = SERIAL_ERRORS.labels(name)
+        self._superseded = SERIAL_SUPERSEDED.labels(name)
+        self._queue_seconds = {
+            "command": SERIAL_QUEUE_SECONDS.labels(name, "command"),
+            "telemetry": SERIAL_QUEUE_SECONDS.labels(name, "telemetry"),
+        }
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stops after writing what is already queued (at most `timeout` s)."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def send(self, data, log_message=None, key=None):
+        """Queues `data` (bytes, or str for write_str) and returns at once."""
+        item = (data, log_message, time.perf_counter())
+        with self.cond:
+            if key is None:
+                self.commands.append(item)
+            else:
+                if key in self.telemetry:
+                    self.superseded += 1
+                    self._superseded.inc()
+                self.telemetry[key] = item
+            self.cond.notify()
+
+    def _next(self):
+        with self.cond:
+            while not self.commands and not self.telemetry:
+                if self.stopped:
+                    return None, None
+                self.cond.wait()
+            if self.commands:
+                return self.commands.popleft(), "command"
+            return self.telemetry.popitem(last=False)[1], "telemetry"
+
+    def _run(self):
+        while True:
+            item, priority = self._next()
+            if item is None:
+                return
+            data, log_message, queued_at = item
+            self._queue_seconds[priority].observe(time.perf_counter() - queued_at)
+            try:
+                with self._send_seconds.time():
+                    if isinstance(data, str):
+                        self.port.write_str(data)
+                    else:
+                        self.port.write(data)
+            except Exception as e:
+                self._errors.inc()
+                print(f"!!! Error writing to {self.name}: {e}")
+                continue
+            self._bytes_sent.inc(len(data))
+            self.sent += 1
+            if self.on_sent is not None:
+                # 回调出错不能让写线程退出, 否则之后的命令都会卡在队列里
+                try:
+                    self.on_sent(log_message, data)
+                except Exception as e:
+                    self._errors.inc()
+                    print(f"!!! Error after writing to {self.name}: {e}")
+
+    def get_stats(self):
+        with self.cond:
+            return {
+                "queued_commands": len(self.commands),
+                "queued_telemetry": len(self.telemetry),
+                "sent": self.sent,
+                "superseded": self.superseded,
+            }
@@ -0,0 +1,235 @@
+# app/modules/serial_protocol.py
+import collections
+import struct
+
+from .metrics import SERIAL_FRAME_ERRORS
+
+HEADER = b"\xaa\x55"
+TAIL = b"\r\n"
+# 帧头2 + 类型1 + 长度1 + 校验1 + 帧尾2
+FRAME_OVERHEAD = 7
+
+BINARY, TEXT = "binary", "text"
+
+# 0x03 批量视觉数据: 头 (采集时间ms, 色块数, AprilTag数) + 每个目标8字节
+# 色块: offset_x, offset_y, angle, color_index; AprilTag: offset_x, offset_y, distance, id
+BATCH_TYPE = 0x03
+BATCH_HEADER = struct.Struct(">IBB")
+BATCH_RECORD = struct.Struct(">hhhh")
+BATCH_MAX_RECORDS = (255 - BATCH_HEADER.size) // BATCH_RECORD.size
+
+# kind: BINARY / TEXT; type: 二进制帧的数据类型 (文本帧为 None)
+# payload: 二进制帧为 bytes, 文本帧为去掉 "##" 和换行的 str
+Frame = collections.namedtuple("Frame", ["kind", "type", "payload"])
+
+
+def encode_packet(data_type, payload):
+    """AA 55 | type | len | payload | checksum | 0D 0A, checksum = type+len+sum(payload)."""
+    length = len(payload)
+    checksum = (data_type + length + sum(payload)) & 0xFF
+    return HEADER + bytes((data_type, length)) + payload + bytes((checksum,)) + TAIL
+
+
+class BatchPacketBuilder:
+    """Builds 0x03 packets (all blobs and tags of one frame) in a reused buffer.
+
+    Header and records are written with precompiled structs via
+    `pack_into`, so building a packet allocates nothing. `build()` returns
+    a memoryview that is only valid until the next call.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray(FRAME_OVERHEAD + 255)
+        self.buffer[0:2] = HEADER
+        self.buffer[2] = BATCH_TYPE
+        self.view = memoryview(self.buffer)
+
+    def build(self, timestamp_ms, blobs, tags):
+        """`blobs` / `tags` are 4-tuples of ints; extra records are dropped."""
+        if len(blobs) + len(tags) > BATCH_MAX_RECORDS:
+            blobs = blobs[:BATCH_MAX_RECORDS]
+            tags = tags[: BATCH_MAX_RECORDS - len(blobs)]
+        buf = self.buffer
+        BATCH_HEADER.pack_into(buf, 4, timestamp_ms & 0xFFFFFFFF, len(blobs), len(tags))
+        offset = 4 + BATCH_HEADER.size
+        for record in blobs:
+            BATCH_RECORD.pack_into(buf, offset, *record)
+            offset += BATCH_RECORD.size
+        for record in tags:
+            BATCH_RECORD.pack_into(buf, offset, *record)
+            offset += BATCH_RECORD.size
+        length = offset - 4
+        buf[3] = length
+        buf[offset] = (BATCH_TYPE + length + sum(buf[4:offset])) & 0xFF
+        buf[offset + 1] = 0x0D
+        buf[offset + 2] = 0x0A
+        return self.view[: offset + 3]
+
+
+class FrameDecoder:
+    """Incremental decoder for the UART traffic of the arm and the car.
+
+    Bytes are fed as they arrive, in whatever chunks the port returns, and
+    every complete frame is returned in order. Three framings are accepted:
+    binary `AA 55` packets (same layout and checksum as `encode_packet`),
+    `##...\\r\\n` commands and plain newline-terminated lines. A read may
+    hold several frames or a fraction of one; the rest waits in the buffer
+    for the next `feed()`. The buffer is scanned in place through a
+    memoryview and compacted once per call. A binary frame's payload is
+    copied exactly once, into the `bytes` its Frame keeps after the
+    buffer is compacted.
+
+    A binary frame with a bad checksum or tail is counted, and the decoder
+    skips ahead to the next header or line end to resynchronize. Text
+    without a terminator is only returned by `flush()`, which the I/O loop
+    calls once the line has been idle.
+    """
+
+    def __init__(self, name=None, max_buffer=4096):
+        self.name = name
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+        self.skipping = False
+        self.frames = 0
+        self.checksum_errors = 0
+        self.framing_errors = 0
+        self.discarded_bytes = 0
+        self._errors = {}
+        if name:
+            self._errors = {
+                reason: SERIAL_FRAME_ERRORS.labels(name, reason)
+                for reason in ("checksum", "framing", "overflow", "truncated")
+            }
+
+    def _error(self, reason):
+        counter = self._errors.get(reason)
+        if counter is not None:
+            counter.inc()
+
+    def feed(self, data):
+        """Appends `data` and returns the list of frames it completed."""
+        buf = self.buffer
+        buf += data
+        frames = []
+        pos = self._parse(buf, 0, frames)
+        if pos:
+            del buf[:pos]
+        if len(buf) > self.max_buffer:
+            self.discarded_bytes += len(buf)
+            self._error("overflow")
+            buf.clear()
+        self.frames += len(frames)
+        return frames
+
+    def flush(self):
+        """Returns the unterminated text still buffered (called after idle)."""
+        buf = self.buffer
+        frames = []
+        if not buf:
+            return frames
+        if buf.startswith(HEADER):
+            # 二进制帧不完整, 丢掉帧头后重新同步
+            self.framing_errors += 1
+            self._error("truncated")
+            self.discarded_bytes += 1
+            self.skipping = True
+            pos = self._parse(buf, 1, frames)
+            del buf[:pos]
+        if self.skipping:
+            self.discarded_bytes += len(buf)
+            self.skipping = False
+            buf.clear()
+        elif buf and not buf.startswith(HEADER):
+            self._text(frames, buf, 0, len(buf))
+            buf.clear()
+        self.frames += len(frames)
+        return frames
+
+    def _parse(self, buf, pos, frames):
+        # 视图必须在返回前释放, 否则调用方无法压缩 (del) 缓冲区
+        with memoryview(buf) as view:
+            return self._scan(buf, view, pos, frames)
+
+    def _scan(self, buf, view, pos, frames):
+        end = len(buf)
+        while pos < end:
+            if self.skipping:
+                pos = self._resync(buf, pos, end)
+                if self.skipping:
+                    break
+                continue
+            if buf[pos] == 0xAA and (end - pos < 2 or buf[pos + 1] == 0x55):
+                if end - pos < 4:
+                    break
+                length = buf[pos + 3]
+                if end - pos < length + FRAME_OVERHEAD:
+                    break
+                data_type = buf[pos + 2]
+                start = pos + 4
+                stop = start + length
+                # 唯一一次复制: Frame 要持有的 payload (对 bytes 求和也比对视图快)
+                payload = bytes(view[start:stop])
+                checksum = (data_type + length + sum(payload)) & 0xFF
+                if buf[stop] != checksum:
+                    self.checksum_errors += 1
+                    self._error("checksum")
+                elif buf[stop + 1] != 0x0D or buf[stop + 2] != 0x0A:
+                    self.framing_errors += 1
+                    self._error("framing")
+                else:
+                    frames.append(Frame(BINARY, data_type, payload))
+                    pos = stop + 3
+                    continue
+                self.discarded_bytes += 1
+                self.skipping = True
+                pos += 1
+                continue
+            newline = buf.find(b"\n", pos)
+            header = buf.find(HEADER, pos)
+            if header != -1 and (newline == -1 or header < newline):
+                # 帧头前没有换行的文本: 当作一条完整消息
+                self._text(frames, buf, pos, header)
+                pos = header
+            elif newline != -1:
+                self._text(frames, buf, pos, newline)
+                pos = newline + 1
+            else:
+                break
+        return pos
+
+    def _resync(self, buf, pos, end):
+        """Drops bytes up to the next header or through the next line end."""
+        newline = buf.find(b"\n", pos)
+        header = buf.find(HEADER, pos)
+        if header != -1 and (newline == -1 or header < newline):
+            stop = header
+        elif newline != -1:
+            stop = newline + 1
+        else:
+            # 末尾的 0xAA 可能是下一帧帧头的前半个字节
+            stop = end - 1 if buf[end - 1] == 0xAA else end
+            self.discarded_bytes += stop - pos
+            return stop
+        self.discarded_bytes += stop - pos
+        self.skipping = False
+        return stop
+
+    def _text(self, frames, buf, start, stop):
+        # 文本帧本来就要解码成 str, 切片这一次复制省不掉
+        line = buf[start:stop].decode("utf-8", errors="ignore").strip()
+        if not line.isprintable():
+            # 线路噪声产生的控制字符
+            line = "".join(ch for ch in line if ch.isprintable())
+        if line.startswith("##"):
+            line = line[2:].strip()
+        if line:
+            frames.append(Frame(TEXT, None, line))
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "checksum_errors": self.checksum_errors,
+            "framing_errors": self.framing_errors,
+            "discarded_bytes": self.discarded_bytes,
+            "pending_bytes": len(self.buffer),
+        }
@@ -0,0 +1,198 @@
+# app/modules/streaming.py
+import threading
+import time
+import itertools
+
+from .pipeline import DropOldestQueue
+
+MJPEG_BOUNDARY = "frame"
+
+
+def make_mjpeg_chunk(jpeg_bytes):
+    return (
+        b"--" + MJPEG_BOUNDARY.encode() + b"\r\n"
+        b"Content-Type: image/jpeg\r\n\r\n" + jpeg_bytes + b"\r\n"
+    )
+
+
+class StreamClient:
+    def __init__(self, client_id, remote_addr, queue_size, max_fps=None):
+        self.client_id = client_id
+        self.remote_addr = remote_addr
+        self.connected_at = time.time()
+        self.queue = DropOldestQueue(queue_size)
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.last_queued = 0.0
+        self.channel = None
+        self.delivered = 0
+        self.throttled = 0
+
+    def offer(self, chunk, now):
+        """Queues a chunk unless this client's max-fps limit says to skip it."""
+        if self.min_interval and now - self.last_queued < self.min_interval:
+            self.throttled += 1
+            return
+        self.last_queued = now
+        self.queue.put(chunk)
+
+    def get_stats(self):
+        return {
+            "id": self.client_id,
+            "remote_addr": self.remote_addr,
+            "variant": self.channel.describe() if self.channel else None,
+            "max_fps": round(1.0 / self.min_interval, 1) if self.min_interval else None,
+            "connected_for_s": round(time.time() - self.connected_at, 1),
+            "delivered": self.delivered,
+            "dropped": self.queue.dropped,
+            "throttled": self.throttled,
+        }
+
+
+class StreamChannel:
+    """All subscribers of one stream variant, fed by one pump thread."""
+
+    def __init__(self, vision_processor, variant_key):
+        self.vision_processor = vision_processor
+        self.variant_key = variant_key
+        self.clients = {}
+        self.stopped = False
+        self.thread = threading.Thread(target=self._pump_loop, daemon=True)
+
+    def describe(self):
+        width, height, quality = self.variant_key
+        return f"{width}x{height}@q{quality}"
+
+    def _pump_loop(self):
+        last_seq = 0
+        while not self.stopped:
+            frame = self.vision_processor.wait_for_frame(
+                last_seq, timeout=0.5, variant_key=self.variant_key
+            )
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            clients = list(self.clients.values())
+            if not clients:
+                continue
+            chunk = make_mjpeg_chunk(frame.jpeg)
+            now = time.monotonic()
+            for client in clients:
+                client.offer(chunk, now)
+
+
+class MjpegBroadcaster:
+    """Fans each encoded frame out to every /video_feed subscriber.
+
+    Subscribers are grouped into one channel per (size, quality) variant.
+    Each channel has a single pump thread that waits for new frames of its
+    variant and builds the multipart chunk once; every client gets a
+    reference to the same bytes in its own small drop-oldest queue. A client
+    whose socket is backed up stops draining its queue and simply loses the
+    older frames, without slowing down anybody else. The VisionProcessor
+    only encodes a variant while its channel exists.
+    """
+
+    def __init__(self, vision_processor, max_viewers=5, client_queue_size=2):
+        self.vision_processor = vision_processor
+        self.max_viewers = max_viewers
+        self.client_queue_size = client_queue_size
+        self.channels = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.rejected = 0
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+        with self.lock:
+            channels = list(self.channels.values())
+            self.channels.clear()
+        for channel in channels:
+            channel.stopped = True
+            self.vision_processor.release_stream_variant(channel.variant_key)
+
+    def _viewer_count(self):
+        return sum(len(channel.clients) for channel in self.channels.values())
+
+    def subscribe(
+        self, remote_addr=None, width=None, height=None, quality=None, max_fps=None
+    ):
+        """Registers a new viewer; returns (client, None) or (None, reason)."""
+        with self.lock:
+            if self.stopped:
+                return None, "Stream is shutting down"
+            if self.max_viewers and self._viewer_count() >= self.max_viewers:
+                self.rejected += 1
+                return None, "Viewer limit reached"
+            kwargs = {"width": width, "height": height}
+            if quality is not None:
+                kwargs["quality"] = quality
+            variant_key = self.vision_processor.acquire_stream_variant(**kwargs)
+            if variant_key is None:
+                self.rejected += 1
+                return None, "Unsupported or too many stream variants"
+
+            channel = self.channels.get(variant_key)
+            new_channel = channel is None
+            if new_channel:
+                channel = StreamChannel(self.vision_processor, variant_key)
+                self.channels[variant_key] = channel
+            else:
+                # 每个频道只向视觉处理器登记一次
+                self.vision_processor.release_stream_variant(variant_key)
+
+            client = StreamClient(
+                next(self._ids), remote_addr, self.client_queue_size, max_fps
+            )
+            client.channel = channel
+            channel.clients[client.client_id] = client
+        if new_channel:
+            channel.thread.start()
+        print(
+            f"Stream client {client.client_id} ({remote_addr}) connected "
+            f"to {channel.describe()}."
+        )
+        return client, None
+
+    def unsubscribe(self, client):
+        channel = client.channel
+        with self.lock:
+            removed = channel.clients.pop(client.client_id, None)
+            if removed is None:
+                return
+            if (
+                not channel.clients
+                and self.channels.get(channel.variant_key) is channel
+            ):
+                del self.channels[channel.variant_key]
+                channel.stopped = True
+                self.vision_processor.release_stream_variant(channel.variant_key)
+        print(
+            f"Stream client {client.client_id} disconnected "
+            f"(delivered {client.delivered}, dropped {client.queue.dropped})."
+        )
+
+    def stream(self, client):
+        """Generator for one HTTP response; ends when the broadcaster stops.
+
+        The caller must arrange for `unsubscribe(client)` to run when the
+        response is closed (a generator that never started has no `finally`).
+        """
+        while not self.stopped and not client.channel.stopped:
+            chunk = client.queue.get(timeout=1.0)
+            if chunk is None:
+                continue
+            yield chunk
+            client.delivered += 1
+
+    def get_stats(self):
+        with self.lock:
+            clients = [c for ch in self.channels.values() for c in ch.clients.values()]
+            channels = [ch.describe() for ch in self.channels.values()]
+        return {
+            "viewers": len(clients),
+            "max_viewers": self.max_viewers,
+            "rejected": self.rejected,
+            "channels": channels,
+            "clients": [client.get_stats() for client in clients],
+        }
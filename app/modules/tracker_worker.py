@@ -0,0 +1,64 @@
+# app/modules/tracker_worker.py
+import threading
+import time
+
+from .pipeline import DropOldestQueue
+
+
+class TrackerInitWorker:
+    """Runs the (slow) tracker initialization on one long-lived thread.
+
+    Each request carries a private copy of the frame, so the vision loop
+    can keep drawing on and encoding its own image. Only the newest
+    pending request matters; an older one still waiting is dropped.
+    `on_done(generation, ok, error)` is called from the worker thread, and
+    the caller uses `generation` to ignore results of superseded requests.
+    `lock` is held for the whole `init()`; the caller takes it around
+    `track()` so the two never run on the model at the same time.
+    """
+
+    def __init__(self, tracker, on_done, lock=None):
+        self.tracker = tracker
+        self.on_done = on_done
+        self.lock = lock or threading.Lock()
+        self.requests = DropOldestQueue(1)
+        self.stopped = False
+        self.inits = 0
+        self.failures = 0
+        self.last_init_ms = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def submit(self, img_copy, rect, generation):
+        self.requests.put((img_copy, rect, generation))
+
+    def _run(self):
+        while not self.stopped:
+            request = self.requests.get(timeout=0.5)
+            if request is None:
+                continue
+            img_copy, (x, y, w, h), generation = request
+            started = time.monotonic()
+            try:
+                with self.lock:
+                    self.tracker.init(img_copy, x, y, w, h)
+                ok, error = True, None
+                self.inits += 1
+            except Exception as e:
+                ok, error = False, e
+                self.failures += 1
+            self.last_init_ms = (time.monotonic() - started) * 1000
+            self.on_done(generation, ok, error)
+
+    def get_stats(self):
+        return {
+            "inits": self.inits,
+            "failures": self.failures,
+            "pending": self.requests.qsize(),
+            "last_init_ms": round(self.last_init_ms, 2),
+        }
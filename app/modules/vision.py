@@ -1,11 +1,11 @@
 # app/modules/vision.py
 import threading
 import time
-import tempfile
 import os
 import math
-import copy
 import json
+import collections
+import functools
 
 try:
     from maix import camera, image, nn, display
@@ -13,9 +13,55 @@ except (ImportError, ModuleNotFoundError):
     print("!!! maix library not found, switching to MOCK mode for development. !!!")
     from .maix_mock import camera, image, nn
 
+from .pipeline import DropOldestQueue, StageStats, VersionedSlot
+from .detector_scheduler import DetectorScheduler
+from .roi import TemporalROI, bbox_from_corners
+from .overlay import OverlayRecorder
+from .metrics import REGISTRY, LOCK_WAIT_SECONDS, QUEUE_DEPTH, TimedLock
+from .sample_registry import SampleRegistry
+from .motion_filter import AlphaBetaFilter
+from .frame_ring import FrameRing
+from .tracker_worker import TrackerInitWorker
+
 # --- 常量定义 ---
 NANOTRACK_MODEL_PATH = "/root/models/nanotrack.mud"
-TEMP_FRAME_PATH = os.path.join(tempfile.gettempdir(), "vision_frame.jpg")
+JPEG_QUALITY = 90
+MAX_STREAM_VARIANTS = 4
+STAGE_QUEUE_SIZE = 2
+# --- NanoTrack 跟丢后的自动恢复 ---
+TRACK_MIN_SCORE = 0.4  # 低于此置信度视为这一帧没跟上
+TRACK_LOST_FRAMES = 3  # 连续这么多帧没跟上就进入恢复模式
+RECOVERY_TIMEOUT = 2.0  # 恢复模式最长持续时间(秒)，超时后回到 IDLE (重新初始化期间顺延)
+RECOVERY_WINDOW_SCALE = 2.0  # 搜索窗口为上次目标框的倍数
+RECOVERY_WINDOW_STEP = 0.5  # 每次未找到, 窗口倍数再增加这么多
+
+# --- 二维码: 解析结果缓存条数, 以及判定"静止"的角点位移容差(像素) ---
+QR_PAYLOAD_CACHE_SIZE = 64
+QR_STABLE_TOLERANCE_PX = 4
+
+# --- 各检测器的默认调度参数 (IDLE状态下) ---
+DETECTOR_SCHEDULE_DEFAULTS = {
+    "color_block": {"every_n": 1},
+    "apriltag": {"every_n": 1},
+    # 二维码内容很少变化，默认每秒只检测两次
+    "qrcode": {"every_n": 1, "rate_hz": 2.0},
+}
+
+# --- 运行指标 (/api/metrics) ---
+STAGE_SECONDS = REGISTRY.histogram(
+    "vision_stage_seconds",
+    "Time per frame in each vision pipeline stage (detect = whole frame processing).",
+    ("stage",),
+)
+STAGE_FPS = REGISTRY.gauge(
+    "vision_stage_fps", "Recent throughput of each vision pipeline stage.", ("stage",)
+)
+DETECTOR_SECONDS = REGISTRY.histogram(
+    "vision_detector_seconds", "Time per detector run.", ("detector",)
+)
+FRAMES_TOTAL = REGISTRY.counter(
+    "vision_frames_total", "Frames processed, by render mode.", ("mode",)
+)
 
 # --- 颜色阈值字典 ---
 COLOR_THRESHOLDS = {
@@ -25,7 +71,16 @@ COLOR_THRESHOLDS = {
     "purple": ([[28, 68, 12, 52, -80, -40]], 3),
 }
 
-# --- 内置信息字典 ---
+# --- 多颜色模式：一次 find_blobs 调用搜索全部颜色 ---
+MULTI_COLOR_KEY = "all"
+ALL_COLOR_THRESHOLDS = []
+THRESHOLD_COLOR_KEYS = []  # 第 i 个阈值对应的颜色, 与 blob.code() 的第 i 位对应
+for _color_key, (_thresholds, _) in COLOR_THRESHOLDS.items():
+    for _threshold in _thresholds:
+        ALL_COLOR_THRESHOLDS.append(_threshold)
+        THRESHOLD_COLOR_KEYS.append(_color_key)
+
+# --- 内置信息字典 (未配置样本库 SAMPLE_REGISTRY_PATH 时使用) ---
 ORGANS_INFO = {
     "ORG-2025-0001": {
         "编号": "ORG-2025-0001",
@@ -48,12 +103,57 @@ ORGANS_INFO = {
 }
 
 
+# --- 检测结果快照：发布后不可修改，读取方无需加锁或拷贝 ---
+DetectionSnapshot = collections.namedtuple(
+    "DetectionSnapshot", ["seq", "timestamp", "data"]
+)
+
+# --- 编码后的视频帧，seq 与快照一样单调递增 ---
+EncodedFrame = collections.namedtuple("EncodedFrame", ["seq", "timestamp", "jpeg"])
+
+
+class StreamVariant:
+    """One (width, height, quality) encoding of the video stream.
+
+    A variant is only encoded while `refcount` > 0, i.e. while at least one
+    stream client is subscribed to it.
+    """
+
+    def __init__(self, width, height, quality):
+        self.width = width
+        self.height = height
+        self.quality = quality
+        self.refcount = 0
+        self.frames = VersionedSlot(None)
+        self.encoded = 0
+
+    @property
+    def key(self):
+        return (self.width, self.height, self.quality)
+
+    def publish(self, jpeg_bytes, capture_time):
+        # 只有输出线程发布视频帧，seq 无需额外加锁
+        frame = EncodedFrame(self.frames.seq + 1, capture_time, jpeg_bytes)
+        self.frames.publish(frame)
+        self.encoded += 1
+        return frame
+
+    def get_stats(self):
+        return {
+            "size": f"{self.width}x{self.height}",
+            "quality": self.quality,
+            "subscribers": self.refcount,
+            "encoded": self.encoded,
+        }
+
+
 # --- 视觉处理器状态定义 ---
 class VisionState:
     IDLE = 0
     PENDING_INIT = 1
     INITIALIZING = 2
     TRACKING = 3
+    RECOVERING = 4
 
 
 class VisionProcessor:
@@ -62,6 +162,7 @@ class VisionProcessor:
         self.detector = None
         print("--- YOLOv5 detection is permanently disabled. ---")
 
+        self.width, self.height = width, height
         self.cam = camera.Camera(width, height)
         print(f"Camera Initialized ({width}x{height})")
 
@@ -89,35 +190,140 @@ class VisionProcessor:
         self.APRILTAG_FAMILIES = image.ApriltagFamilies.TAG36H11
         self.APRILTAG_DISTANCE_FACTOR_K = 20.0
 
+        self.scheduler = DetectorScheduler(DETECTOR_SCHEDULE_DEFAULTS)
+        # --- 在上一帧目标附近的窗口内搜索 (色块 / AprilTag) ---
+        self.rois = {
+            "color_block": TemporalROI(width, height),
+            "apriltag": TemporalROI(width, height),
+            # 在上次二维码附近搜索, 每30帧做一次全画面搜索以发现新的二维码
+            "qrcode": TemporalROI(width, height),
+        }
+        # --- 目标运动滤波: 平滑偏移量并估计速度, 供机械臂按发送时刻外推 ---
+        self.motion_filters = {
+            "color_block": AlphaBetaFilter(
+                ("offset_x", "offset_y", "angle"),
+                # 角度范围 0~90, 只有正方形目标的 90° 才等于 0°, 所以不做回绕
+                limits={"angle": (0, 90)},
+                velocity_names={"offset_x": "vx", "offset_y": "vy"},
+            ),
+            "apriltag": AlphaBetaFilter(
+                ("offset_x", "offset_y", "distance"),
+                velocity_names={"offset_x": "vx", "offset_y": "vy"},
+            ),
+        }
+        self._last_qr = None
+        self.qr_stats = {"decodes": 0, "stable_reuses": 0}
+        self.sample_registry = SampleRegistry(fallback=ORGANS_INFO)
+        self._format_qr_payload = _qr_payload_cache(self.sample_registry)
+
         self.state = VisionState.IDLE
         self.init_rect = None
         self.init_start_time = 0
         self.INIT_TIMEOUT = 3.0
 
-        self.latest_jpeg = None
-        self.latest_data = {
-            "color_block": {"detected": False},
-            "apriltag": {"detected": False},
-            "nanotrack": {"detected": False, "status": "IDLE"},
-            "qrcode": {"detected": False, "payload": None},
-        }
-        self.lock = threading.Lock()
+        # --- [核心修改] 常驻的跟踪器初始化线程 + 跟丢后自动恢复 ---
+        self.tracker_worker = None
+        # init() 和 track() 不能同时作用在同一个 NanoTrack 模型上
+        self.tracker_lock = threading.Lock()
+        if self.tracker:
+            self.tracker_worker = TrackerInitWorker(
+                self.tracker, self._on_tracker_initialized, self.tracker_lock
+            )
+        self.track_generation = 0
+        self.init_is_recovery = False
+        self.last_track_rect = None
+        self.track_thresholds = None
+        self.low_score_frames = 0
+        self.recovery_deadline = 0
+        self.recovery_attempts = 0
+        self.track_stats = {"recoveries": 0, "recovered": 0, "lost": 0}
+
+        # --- [核心修改] 多分辨率/多质量的视频流，只编码有人订阅的版本 ---
+        self.variants_lock = TimedLock(LOCK_WAIT_SECONDS.labels("vision_variants"))
+        default_variant = StreamVariant(width, height, JPEG_QUALITY)
+        self.default_variant_key = default_variant.key
+        self.stream_variants = {default_variant.key: default_variant}
+        self.frames = default_variant.frames
+        self.active_variant_count = 0
+        # 最近N帧的回放缓冲区 (默认关闭, 见 enable_frame_ring)
+        self.frame_ring = None
+
+        # --- [核心修改] 无人观看时跳过叠加绘制与编码，检测照常进行 ---
+        self._last_overlays = {}
+        self.render_mode = "detect_only"
+        self.render_counts = {"render": 0, "detect_only": 0}
+        self.snapshots = VersionedSlot(
+            DetectionSnapshot(
+                0,
+                time.time(),
+                {
+                    "color_block": {"detected": False},
+                    "apriltag": {"detected": False},
+                    "nanotrack": {"detected": False, "status": "IDLE"},
+                    "qrcode": {"detected": False, "payload": None},
+                },
+            )
+        )
+        self.publish_lock = TimedLock(LOCK_WAIT_SECONDS.labels("vision_publish"))
+        self.lock = TimedLock(LOCK_WAIT_SECONDS.labels("vision_state"))
         self.stopped = False
+
+        # --- [核心修改] 采集 / 检测 / 编码 三级流水线 ---
+        self.frame_queue = DropOldestQueue(
+            STAGE_QUEUE_SIZE, QUEUE_DEPTH.labels("vision_frame_queue")
+        )
+        self.output_queue = DropOldestQueue(
+            STAGE_QUEUE_SIZE, QUEUE_DEPTH.labels("vision_output_queue")
+        )
+        self.stage_stats = {}
+        for stage in ("capture", "detect", "output"):
+            self.stage_stats[stage] = StageStats(
+                stage, histogram=STAGE_SECONDS.labels(stage)
+            )
+            STAGE_FPS.labels(stage).set_function(self.stage_stats[stage].fps)
+        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.thread = threading.Thread(target=self.run, daemon=True)
+        self.output_thread = threading.Thread(target=self._output_loop, daemon=True)
 
-    def _initialize_tracker_task(self, img_copy, x, y, w, h):
-        try:
-            self.tracker.init(img_copy, x, y, w, h)
-            with self.lock:
-                if self.state == VisionState.INITIALIZING:
-                    self.state = VisionState.TRACKING
-        except Exception as e:
-            with self.lock:
+    def _on_tracker_initialized(self, generation, ok, error):
+        """Called on the tracker worker thread when an init request finishes."""
+        with self.lock:
+            if (
+                generation != self.track_generation
+                or self.state != VisionState.INITIALIZING
+            ):
+                return
+            if ok:
+                self.state = VisionState.TRACKING
+                self.low_score_frames = 0
+                if self.init_is_recovery:
+                    self.track_stats["recovered"] += 1
+            elif self.init_is_recovery:
+                self.state = VisionState.RECOVERING
+            else:
                 self.state = VisionState.IDLE
-                self.latest_data["nanotrack"] = {
-                    "detected": False,
-                    "status": "INIT_FAILED",
-                }
+        if not ok and not self.init_is_recovery:
+            print(f"!!! Tracker init failed: {error}")
+            self._publish_data(
+                {"nanotrack": {"detected": False, "status": "INIT_FAILED"}}
+            )
+
+    def _submit_tracker_init(self, img, rect, recovery=False):
+        with self.lock:
+            self.track_generation += 1
+            generation = self.track_generation
+            self.state = VisionState.INITIALIZING
+            self.init_start_time = time.time()
+            self.init_rect = None
+            self.init_is_recovery = recovery
+            self.last_track_rect = rect
+            if recovery:
+                # 重新初始化最多可用 INIT_TIMEOUT, 恢复的截止时间不能比它早
+                self.recovery_deadline = max(
+                    self.recovery_deadline, self.init_start_time + self.INIT_TIMEOUT
+                )
+        # 初始化线程拿到的是私有副本，本线程随后在 img 上绘制和编码互不影响
+        self.tracker_worker.submit(img.copy(), rect, generation)
 
     def start_tracking(self, x, y, w, h):
         if not self.tracker:
@@ -125,106 +331,261 @@ class VisionProcessor:
         with self.lock:
             self.init_rect = (x, y, w, h)
             self.state = VisionState.PENDING_INIT
-            self.latest_data["nanotrack"] = {
-                "detected": False,
-                "status": "PENDING_INIT",
-            }
+        self._publish_data({"nanotrack": {"detected": False, "status": "PENDING_INIT"}})
         return True
 
     def stop_tracking(self):
         with self.lock:
             self.state = VisionState.IDLE
             self.init_rect = None
+            self.track_generation += 1
         print("Tracking stopped. State reset to IDLE.")
 
     def start(self):
+        self.capture_thread.start()
         self.thread.start()
+        self.output_thread.start()
+        if self.tracker_worker:
+            self.tracker_worker.start()
 
     def stop(self):
         self.stopped = True
+        if self.tracker_worker:
+            self.tracker_worker.stop()
 
-    def run(self):
+    def _capture_loop(self):
+        """Stage 1: grab frames as fast as the camera delivers them."""
+        stats = self.stage_stats["capture"]
         while not self.stopped:
+            started = time.monotonic()
             img = self.cam.read()
             if not img:
                 time.sleep(0.01)
                 continue
+            self.frame_queue.put((img, time.time()))
+            stats.record(started)
+
+    def run(self):
+        """Stage 2: tracking state machine, detection and overlay drawing."""
+        stats = self.stage_stats["detect"]
+        while not self.stopped:
+            item = self.frame_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            img, capture_time = item
+            started = time.monotonic()
 
             current_state = self.state
 
             if current_state == VisionState.PENDING_INIT:
-                if self.init_rect:
-                    x, y, w, h = self.init_rect
-                    init_thread = threading.Thread(
-                        target=self._initialize_tracker_task,
-                        args=(img, x, y, w, h),
-                    )
-                    init_thread.daemon = True
-                    init_thread.start()
-                    with self.lock:
-                        self.state = VisionState.INITIALIZING
-                        self.init_start_time = time.time()
-                        self.init_rect = None
+                init_rect = self.init_rect
+                if init_rect:
+                    self.track_thresholds = self._target_thresholds(img, init_rect)
+                    self._submit_tracker_init(img, init_rect)
 
             elif current_state == VisionState.INITIALIZING:
                 if time.time() - self.init_start_time > self.INIT_TIMEOUT:
-                    self.stop_tracking()
-
-            if self.state == VisionState.TRACKING:
-                track_data = self._track_target(img)
-                with self.lock:
-                    self.latest_data.update(
-                        {
-                            "color_block": {"detected": False},
-                            "apriltag": {"detected": False},
-                            "qrcode": {"detected": False, "payload": None},
-                            "nanotrack": track_data,
-                        }
-                    )
+                    if self.init_is_recovery:
+                        with self.lock:
+                            self.state = VisionState.RECOVERING
+                    else:
+                        self.stop_tracking()
+
+            overlays = []
+            if self.state in (VisionState.TRACKING, VisionState.RECOVERING):
+                overlay = OverlayRecorder()
+                with DETECTOR_SECONDS.labels("nanotrack").time():
+                    if self.state == VisionState.TRACKING:
+                        track_data = self._track_target(img, overlay)
+                        self._check_track_quality(track_data)
+                    else:
+                        track_data = self._recover_target(img, overlay)
+                overlays.append(overlay)
+                self._publish_data(
+                    {
+                        "color_block": {"detected": False},
+                        "apriltag": {"detected": False},
+                        "qrcode": {"detected": False, "payload": None},
+                        "nanotrack": track_data,
+                    },
+                    capture_time,
+                )
             elif self.state == VisionState.IDLE:
+                now = time.monotonic()
                 blob_data = (
-                    self._detect_blobs(img)
+                    self._run_detector(
+                        "color_block", self._detect_blobs, img, now, overlays
+                    )
                     if self.blob_detection_enabled
                     else {"detected": False}
                 )
-                apriltag_data = self._detect_apriltags(img)
+                apriltag_data = self._run_detector(
+                    "apriltag", self._detect_apriltags, img, now, overlays
+                )
                 qrcode_data = (
-                    self._detect_qrcodes(img)
+                    self._run_detector(
+                        "qrcode", self._detect_qrcodes, img, now, overlays
+                    )
                     if self.qrcode_detection_enabled
                     else {"detected": False, "payload": None}
                 )
-                with self.lock:
-                    self.latest_data.update(
-                        {
-                            "color_block": blob_data,
-                            "apriltag": apriltag_data,
-                            "qrcode": qrcode_data,
-                            "nanotrack": {"detected": False, "status": "IDLE"},
-                        }
-                    )
+                blob_data = self._filter_target("color_block", blob_data, capture_time)
+                apriltag_data = self._filter_target(
+                    "apriltag", apriltag_data, capture_time
+                )
+                self._publish_data(
+                    {
+                        "color_block": blob_data,
+                        "apriltag": apriltag_data,
+                        "qrcode": qrcode_data,
+                        "nanotrack": {"detected": False, "status": "IDLE"},
+                    },
+                    capture_time,
+                )
 
-            err = img.save(TEMP_FRAME_PATH, quality=90)
-            jpeg_bytes = None
-            if err == 0:
-                with open(TEMP_FRAME_PATH, "rb") as f:
-                    jpeg_bytes = f.read()
-            with self.lock:
-                self.latest_jpeg = jpeg_bytes
+            if self._rendering_active():
+                for overlay in overlays:
+                    overlay.apply(img)
+                self.output_queue.put((img, capture_time, self.snapshots.value))
+                self.render_mode = "render"
+            else:
+                self.render_mode = "detect_only"
+            self.render_counts[self.render_mode] += 1
+            FRAMES_TOTAL.labels(self.render_mode).inc()
+            stats.record(started)
+
+    def _rendering_active(self):
+        """True if anyone will see the frame: a stream subscriber or the display."""
+        return self.disp is not None or self.active_variant_count > 0
+
+    def _output_loop(self):
+        """Stage 3: JPEG encoding for the stream and the local display."""
+        stats = self.stage_stats["output"]
+        while not self.stopped:
+            item = self.output_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            img, capture_time, snapshot = item
+            started = time.monotonic()
+            # --- [核心修改] 直接在内存中编码JPEG，不再经过临时文件 ---
+            with self.variants_lock:
+                variants = [v for v in self.stream_variants.values() if v.refcount > 0]
+            for variant in variants:
+                frame_img = img
+                if (variant.width, variant.height) != (self.width, self.height):
+                    frame_img = img.resize(variant.width, variant.height)
+                jpeg_bytes = encode_jpeg(frame_img, variant.quality)
+                if jpeg_bytes:
+                    frame = variant.publish(jpeg_bytes, capture_time)
+                    if self.frame_ring and variant.key == self.default_variant_key:
+                        self.frame_ring.put(
+                            jpeg_bytes, capture_time, frame.seq, snapshot
+                        )
             if self.disp:
                 try:
                     self.disp.show(img)
                 except Exception as e:
                     self.disp = None
-            time.sleep(0.05)
+            stats.record(started)
+
+    def _run_detector(self, name, detect_fn, img, now, overlays):
+        """Runs a detector if its schedule allows, else carries forward its last result.
+
+        The detector's overlay (fresh, or the last one when skipped) is
+        appended to `overlays`.
+        """
+        if not self.scheduler.should_run(name, now):
+            last_overlay = self._last_overlays.get(name)
+            if last_overlay:
+                overlays.append(last_overlay)
+            return self.scheduler.carry_forward(name, now)
+        overlay = OverlayRecorder()
+        started = time.monotonic()
+        result = detect_fn(img, overlay)
+        elapsed = time.monotonic() - started
+        DETECTOR_SECONDS.labels(name).observe(elapsed)
+        # 调度器只用调用方的时钟 `now` (基准测试中为虚拟时钟), 实测的只是耗时
+        result = self.scheduler.record(name, result, now - elapsed, finished=now)
+        self._last_overlays[name] = overlay
+        overlays.append(overlay)
+        return result
+
+    def _filter_target(self, name, result, capture_time):
+        """Adds a "filtered" entry (smoothed values + velocities) to a detection.
+
+        Fresh detections update the target's filter; carried-forward ones
+        only report its current state. A miss resets the filter.
+        """
+        motion_filter = self.motion_filters[name]
+        if not result.get("detected"):
+            motion_filter.reset()
+            return result
+        if not result.get("stale"):
+            key = (
+                result.get("color_name") if name == "color_block" else result.get("id")
+            )
+            motion_filter.update(result, capture_time, key)
+        filtered = motion_filter.predict()
+        return dict(result, filtered=filtered) if filtered else result
+
+    def predict_target(self, name, at_time):
+        """Filtered offsets of target `name` extrapolated to `at_time` (time.time())."""
+        motion_filter = self.motion_filters.get(name)
+        return motion_filter.predict(at_time) if motion_filter else None
+
+    def get_detector_schedule(self):
+        return {
+            "config": self.scheduler.get_config(),
+            "stats": self.scheduler.get_stats(),
+        }
+
+    def set_detector_schedule(self, name, **changes):
+        return self.scheduler.set_schedule(name, **changes)
+
+    def set_roi_mode(self, name, enabled):
+        roi_tracker = self.rois.get(name)
+        if not roi_tracker:
+            return False, f"Unknown detector: {name}"
+        status = roi_tracker.set_enabled(enabled)
+        return True, f"ROI search for {name} set to {status}"
+
+    def get_roi_stats(self):
+        return {name: roi.get_stats() for name, roi in self.rois.items()}
 
-    def _track_target(self, img):
+    def get_pipeline_stats(self):
+        return {
+            "stages": {
+                name: stage.get_stats() for name, stage in self.stage_stats.items()
+            },
+            "queues": {
+                "frame_queue": self.frame_queue.get_stats(),
+                "output_queue": self.output_queue.get_stats(),
+            },
+            "stream_variants": self.get_stream_variants(),
+            "qrcode": self.get_qrcode_stats(),
+            "tracking": dict(
+                self.track_stats,
+                worker=self.tracker_worker.get_stats() if self.tracker_worker else None,
+            ),
+            "render": {
+                "mode": self.render_mode,
+                "display_active": self.disp is not None,
+                "frames_rendered": self.render_counts["render"],
+                "frames_detect_only": self.render_counts["detect_only"],
+            },
+        }
+
+    def _track_target(self, img, overlay):
         if not self.tracker:
             return {"detected": False, "status": "ERROR"}
+        # 初始化线程正在用模型: 这一帧不跟踪, 等初始化结果
+        if not self.tracker_lock.acquire(blocking=False):
+            return {"detected": False, "status": "INITIALIZING"}
         try:
             r = self.tracker.track(img)
             if r.w > 0 and r.h > 0:
-                img.draw_rect(r.x, r.y, r.w, r.h, image.COLOR_RED, 3)
-                img.draw_string(
+                overlay.draw_rect(r.x, r.y, r.w, r.h, image.COLOR_RED, 3)
+                overlay.draw_string(
                     r.x, r.y - 15, f"Tracking: {r.score:.2f}", image.COLOR_RED
                 )
                 return {
@@ -237,18 +598,124 @@ class VisionProcessor:
                     "score": round(r.score, 2),
                 }
         except Exception as e:
-            self.stop_tracking()
+            print(f"!!! Tracker error: {e}")
+        finally:
+            self.tracker_lock.release()
         return {"detected": False, "status": "LOST"}
 
-    def _detect_qrcodes(self, img):
-        qrcodes = img.find_qrcodes()
+    def _check_track_quality(self, track_data):
+        """Switches to RECOVERING after TRACK_LOST_FRAMES poor frames in a row."""
+        if track_data["status"] == "INITIALIZING":
+            return
+        if track_data["detected"] and track_data["score"] >= TRACK_MIN_SCORE:
+            self.low_score_frames = 0
+            self.last_track_rect = tuple(
+                int(track_data[k]) for k in ("x", "y", "w", "h")
+            )
+            return
+        self.low_score_frames += 1
+        if self.low_score_frames < TRACK_LOST_FRAMES:
+            return
+        with self.lock:
+            if self.state != VisionState.TRACKING:
+                return
+            self.state = VisionState.RECOVERING
+            self.recovery_deadline = time.time() + RECOVERY_TIMEOUT
+            self.recovery_attempts = 0
+            self.track_stats["recoveries"] += 1
+        print("Track lost, searching to re-acquire the target...")
+
+    def _recover_target(self, img, overlay):
+        """One re-acquisition attempt while RECOVERING.
+
+        The tracker keeps running in case it finds the target again by
+        itself. Otherwise, if the target's color was known when tracking
+        started, that color is searched in a window around the last good
+        box which widens with every failed attempt, and the tracker is
+        re-initialized on the best blob.
+        """
+        if time.time() > self.recovery_deadline:
+            self.track_stats["lost"] += 1
+            self.stop_tracking()
+            return {"detected": False, "status": "LOST"}
+
+        track_data = self._track_target(img, overlay)
+        if track_data["status"] == "INITIALIZING":
+            # 上一次重新初始化还在进行 (已超过 INIT_TIMEOUT), 不再提交新的
+            return {"detected": False, "status": "RECOVERING"}
+        if track_data["detected"] and track_data["score"] >= TRACK_MIN_SCORE:
+            with self.lock:
+                if self.state == VisionState.RECOVERING:
+                    self.state = VisionState.TRACKING
+                    self.low_score_frames = 0
+                    self.track_stats["recovered"] += 1
+            return track_data
+
+        self.recovery_attempts += 1
+        window = self._recovery_window(self.recovery_attempts)
+        overlay.draw_rect(*window, image.COLOR_RED, 1)
+        rect = self._find_target_blob(img, window) if self.track_thresholds else None
+        if rect:
+            self._submit_tracker_init(img, rect, recovery=True)
+        return {"detected": False, "status": "RECOVERING", "window": window}
+
+    def _recovery_window(self, attempt):
+        x, y, w, h = self.last_track_rect
+        scale = RECOVERY_WINDOW_SCALE + (attempt - 1) * RECOVERY_WINDOW_STEP
+        cx, cy = x + w / 2, y + h / 2
+        half_w, half_h = w * scale / 2, h * scale / 2
+        x0, y0 = max(0, int(cx - half_w)), max(0, int(cy - half_h))
+        x1 = min(self.width, int(cx + half_w))
+        y1 = min(self.height, int(cy + half_h))
+        return [x0, y0, max(1, x1 - x0), max(1, y1 - y0)]
+
+    def _target_thresholds(self, img, rect):
+        """Color thresholds matching the largest blob inside the user's box."""
+        try:
+            blobs = img.find_blobs(
+                ALL_COLOR_THRESHOLDS, roi=list(rect), pixels_threshold=20
+            )
+        except Exception:
+            return None
+        if not blobs:
+            return None
+        code = max(blobs, key=lambda b: b.pixels()).code()
+        thresholds = [t for i, t in enumerate(ALL_COLOR_THRESHOLDS) if code & (1 << i)]
+        return thresholds or None
+
+    def _find_target_blob(self, img, window):
+        """Box for re-initializing the tracker: the target-colored blob nearest
+        the last position, kept at the last box size."""
+        x, y, w, h = self.last_track_rect
+        blobs = img.find_blobs(
+            self.track_thresholds,
+            roi=window,
+            pixels_threshold=max(10, w * h // 8),
+            merge=True,
+        )
+        if not blobs:
+            return None
+        cx, cy = x + w / 2, y + h / 2
+        blob = min(blobs, key=lambda b: (b.cx() - cx) ** 2 + (b.cy() - cy) ** 2)
+        nx = min(max(0, blob.cx() - w // 2), self.width - w)
+        ny = min(max(0, blob.cy() - h // 2), self.height - h)
+        return (int(nx), int(ny), w, h)
+
+    def _detect_qrcodes(self, img, overlay):
+        roi_tracker = self.rois["qrcode"]
+        roi = roi_tracker.next_roi()
+        kwargs = {"roi": roi} if roi else {}
+        qrcodes = img.find_qrcodes(**kwargs)
         if not qrcodes:
+            roi_tracker.update(roi, None)
+            self._last_qr = None
             return {"detected": False, "payload": None}
 
         qr = qrcodes[0]
         corners = qr.corners()
+        roi_tracker.update(roi, bbox_from_corners(corners))
         for i in range(4):
-            img.draw_line(
+            overlay.draw_line(
                 corners[i][0],
                 corners[i][1],
                 corners[(i + 1) % 4][0],
@@ -257,51 +724,41 @@ class VisionProcessor:
             )
 
         payload = qr.payload()
-        show_info = None
-        display_str = ""
-
-        try:
-            if isinstance(payload, bytes):
-                payload = payload.decode("utf-8")
-            data = json.loads(payload)
-            code = data.get("编号")
-            if code and code in ORGANS_INFO:
-                info = ORGANS_INFO[code]
-                show_info = "\n".join(
-                    [
-                        f"编号: {info['编号']}",
-                        f"类型: {info['类型']}",
-                        f"供体: {info['供体']}",
-                        f"位置: {info['位置']}",
-                    ]
-                )
-                display_str = f"{info['编号']} {info['类型']}"
-            else:
-                show_info = "\n".join(f"{k}: {v}" for k, v in data.items())
-                key, value = next(iter(data.items()))
-                display_str = f"{key}: {value}"
-        except Exception:
-            if isinstance(payload, bytes):
-                payload = payload.decode("utf-8", errors="replace")
-            if payload in ORGANS_INFO:
-                info = ORGANS_INFO[payload]
-                show_info = "\n".join(
-                    [
-                        f"编号: {info['编号']}",
-                        f"类型: {info['类型']}",
-                        f"供体: {info['供体']}",
-                        f"位置: {info['位置']}",
-                    ]
-                )
-                display_str = f"{info['编号']} {info['类型']}"
-            else:
-                show_info = payload
-                display_str = payload[:10]
+        # --- 同一个样本管静止在镜头下: 角点几乎没动且内容相同, 直接沿用上次的结果 ---
+        last = self._last_qr
+        if (
+            last
+            and last[0] == payload
+            and _max_corner_shift(last[1], corners) <= QR_STABLE_TOLERANCE_PX
+        ):
+            self.qr_stats["stable_reuses"] += 1
+            show_info, display_str = last[2]
+        else:
+            self.qr_stats["decodes"] += 1
+            show_info, display_str = self._format_qr_payload(payload)
+        self._last_qr = (payload, corners, (show_info, display_str))
 
-        img.draw_string(qr.x(), qr.y() - 15, display_str, image.COLOR_RED)
+        overlay.draw_string(qr.x(), qr.y() - 15, display_str, image.COLOR_RED)
 
         return {"detected": True, "payload": show_info}
 
+    def set_sample_registry(self, registry):
+        self.sample_registry = registry
+        # --- 缓存随 registry 一起替换, 旧 registry 及其数据库连接不会被缓存留住 ---
+        self._format_qr_payload = _qr_payload_cache(registry)
+        self._last_qr = None
+        print("Sample registry has been linked to Vision processor.")
+
+    def get_qrcode_stats(self):
+        cache = self._format_qr_payload.cache_info()
+        return dict(
+            self.qr_stats,
+            cache_hits=cache.hits,
+            cache_misses=cache.misses,
+            cache_size=cache.currsize,
+            registry=self.sample_registry.get_stats(),
+        )
+
     def set_blob_detection_status(self, enabled):
         self.blob_detection_enabled = bool(enabled)
         return self.blob_detection_enabled
@@ -311,31 +768,43 @@ class VisionProcessor:
         return self.qrcode_detection_enabled
 
     def set_blob_color_key(self, color_key):
-        if color_key in COLOR_THRESHOLDS:
+        if color_key in COLOR_THRESHOLDS or color_key == MULTI_COLOR_KEY:
             self.active_blob_color_key = color_key
+            self.rois["color_block"].reset()
             return True, f"Color set to {color_key}"
         else:
             return False, f"Invalid color: {color_key}"
 
-    def _detect_blobs(self, img):
+    def _detect_blobs(self, img, overlay):
+        if self.active_blob_color_key == MULTI_COLOR_KEY:
+            return self._detect_all_color_blobs(img, overlay)
         thresholds, color_index = COLOR_THRESHOLDS.get(
             self.active_blob_color_key, (None, -1)
         )
         if not thresholds:
             return {"detected": False}
 
+        roi_tracker = self.rois["color_block"]
+        roi = roi_tracker.next_roi()
+        kwargs = {"roi": roi} if roi else {}
         blobs = img.find_blobs(
-            thresholds, pixels_threshold=self.BLOB_PIXELS_THRESHOLD, merge=True
+            thresholds,
+            pixels_threshold=self.BLOB_PIXELS_THRESHOLD,
+            merge=True,
+            **kwargs,
         )
+        if not blobs:
+            roi_tracker.update(roi, None)
         if blobs:
             largest_blob = max(blobs, key=lambda b: b.area())
             corners = largest_blob.mini_corners()
+            roi_tracker.update(roi, bbox_from_corners(corners))
             _, rotation_deg = calculate_angle_from_corners(corners)
             offset_x = largest_blob.cx() - self.center_x
             offset_y = largest_blob.cy() - self.center_y
             for i in range(4):
                 p1, p2 = corners[i], corners[(i + 1) % 4]
-                img.draw_line(p1[0], p1[1], p2[0], p2[1], image.COLOR_GREEN, 2)
+                overlay.draw_line(p1[0], p1[1], p2[0], p2[1], image.COLOR_GREEN, 2)
             return {
                 "offset_x": int(offset_x),
                 "offset_y": int(offset_y),
@@ -348,10 +817,82 @@ class VisionProcessor:
             }
         return {"detected": False}
 
-    def _detect_apriltags(self, img):
-        tags = img.find_apriltags(families=self.APRILTAG_FAMILIES)
+    def _detect_all_color_blobs(self, img, overlay):
+        """Searches every entry of COLOR_THRESHOLDS with a single find_blobs call.
+
+        merge=False keeps blobs of different colors apart (the backend would
+        otherwise merge overlapping blobs regardless of color); fragments of
+        the same color are merged here instead.
+        """
+        blobs = img.find_blobs(
+            ALL_COLOR_THRESHOLDS,
+            pixels_threshold=self.BLOB_PIXELS_THRESHOLD,
+            merge=False,
+        )
+        by_color = {color_key: [] for color_key in COLOR_THRESHOLDS}
+        for blob in blobs or []:
+            code = blob.code()
+            for i, color_key in enumerate(THRESHOLD_COLOR_KEYS):
+                if code & (1 << i):
+                    by_color[color_key].append(blob)
+                    break
+
+        results = {}
+        largest = None
+        for color_key, color_blobs in by_color.items():
+            color_index = COLOR_THRESHOLDS[color_key][1]
+            records = [
+                self._blob_record(group, color_key, color_index)
+                for group in _merge_overlapping_blobs(color_blobs)
+            ]
+            records.sort(key=lambda r: r["area"], reverse=True)
+            results[color_key] = records
+            if records and (largest is None or records[0]["area"] > largest["area"]):
+                largest = records[0]
+
+        for records in results.values():
+            for record in records:
+                corners = record.pop("corners")
+                for i in range(4):
+                    p1, p2 = corners[i], corners[(i + 1) % 4]
+                    overlay.draw_line(p1[0], p1[1], p2[0], p2[1], image.COLOR_GREEN, 2)
+
+        if largest is None:
+            return {"detected": False, "mode": "multi", "blobs": results}
+        return dict(largest, detected=True, mode="multi", blobs=results)
+
+    def _blob_record(self, group, color_key, color_index):
+        """Builds the per-blob dict for a group of same-color fragments."""
+        main_blob = max(group, key=lambda b: b.area())
+        corners = main_blob.mini_corners()
+        _, rotation_deg = calculate_angle_from_corners(corners)
+        x0, y0, x1, y1 = _blob_rect(group[0])
+        for b in group[1:]:
+            bx0, by0, bx1, by1 = _blob_rect(b)
+            x0, y0 = min(x0, bx0), min(y0, by0)
+            x1, y1 = max(x1, bx1), max(y1, by1)
+        return {
+            "offset_x": int((x0 + x1) // 2 - self.center_x),
+            "offset_y": int((y0 + y1) // 2 - self.center_y),
+            "w": int(x1 - x0),
+            "h": int(y1 - y0),
+            "area": int(sum(b.area() for b in group)),
+            "angle": float(rotation_deg),
+            "color_name": color_key,
+            "color_index": color_index,
+            "corners": corners,
+        }
+
+    def _detect_apriltags(self, img, overlay):
+        roi_tracker = self.rois["apriltag"]
+        roi = roi_tracker.next_roi()
+        kwargs = {"roi": roi} if roi else {}
+        tags = img.find_apriltags(families=self.APRILTAG_FAMILIES, **kwargs)
+        if not tags:
+            roi_tracker.update(roi, None)
         if tags:
             tag = tags[0]
+            roi_tracker.update(roi, bbox_from_corners(tag.corners()))
             cx, cy = tag.cx(), tag.cy()
             offset_x = cx - self.center_x
             offset_y = cy - self.center_y
@@ -361,9 +902,11 @@ class VisionProcessor:
             corners = tag.corners()
             for i in range(4):
                 p1, p2 = corners[i], corners[(i + 1) % 4]
-                img.draw_line(p1[0], p1[1], p2[0], p2[1], image.COLOR_GREEN, 2)
-            img.draw_cross(cx, cy, image.COLOR_GREEN, 10)
-            img.draw_string(cx + 10, cy, f"Dist: {real_distance} mm", image.COLOR_GREEN)
+                overlay.draw_line(p1[0], p1[1], p2[0], p2[1], image.COLOR_GREEN, 2)
+            overlay.draw_cross(cx, cy, image.COLOR_GREEN, 10)
+            overlay.draw_string(
+                cx + 10, cy, f"Dist: {real_distance} mm", image.COLOR_GREEN
+            )
             return {
                 "id": int(tag.id()),
                 "offset_x": int(offset_x),
@@ -373,13 +916,206 @@ class VisionProcessor:
             }
         return {"detected": False}
 
-    def get_latest_frame(self):
-        with self.lock:
-            return self.latest_jpeg
+    def acquire_stream_variant(self, width=None, height=None, quality=JPEG_QUALITY):
+        """Subscribes to a stream encoding; returns its key, or None if refused.
+
+        Sizes larger than the camera frame are refused, and so is a new
+        variant once MAX_STREAM_VARIANTS distinct variants are active.
+        """
+        width = int(width or self.width)
+        height = int(height or self.height)
+        quality = int(quality)
+        if not (0 < width <= self.width and 0 < height <= self.height):
+            return None
+        if not 1 <= quality <= 100:
+            return None
+        key = (width, height, quality)
+        with self.variants_lock:
+            variant = self.stream_variants.get(key)
+            if variant is None:
+                active = sum(1 for v in self.stream_variants.values() if v.refcount > 0)
+                if active >= MAX_STREAM_VARIANTS:
+                    return None
+                variant = StreamVariant(width, height, quality)
+                self.stream_variants[key] = variant
+            if variant.refcount == 0:
+                self.active_variant_count += 1
+            variant.refcount += 1
+        return key
+
+    def enable_frame_ring(self, capacity, slot_size=64 * 1024):
+        """Keeps the last `capacity` default-variant frames with their snapshots.
+
+        The ring holds its own subscription to the default variant, so the
+        frames are rendered and encoded even when nobody is watching.
+        """
+        if self.frame_ring or capacity <= 0:
+            return self.frame_ring
+        self.frame_ring = FrameRing(capacity, slot_size)
+        self.acquire_stream_variant()
+        print(f"Frame ring enabled ({capacity} frames).")
+        return self.frame_ring
+
+    def release_stream_variant(self, key):
+        with self.variants_lock:
+            variant = self.stream_variants.get(key)
+            if variant is None or variant.refcount <= 0:
+                return
+            variant.refcount -= 1
+            if variant.refcount == 0:
+                self.active_variant_count -= 1
+                if key != self.default_variant_key:
+                    del self.stream_variants[key]
+
+    def get_stream_variants(self):
+        with self.variants_lock:
+            return [v.get_stats() for v in self.stream_variants.values()]
+
+    def get_latest_frame(self, variant_key=None):
+        variant = self.stream_variants.get(variant_key or self.default_variant_key)
+        frame = variant.frames.value if variant else None
+        return frame.jpeg if frame else None
+
+    def wait_for_frame(self, after_seq, timeout=None, variant_key=None):
+        """Blocks until a frame newer than `after_seq` is published; None on timeout.
+
+        Returns an EncodedFrame. A slow reader skips straight to the newest
+        frame rather than receiving the stale ones in between.
+        """
+        variant = self.stream_variants.get(variant_key or self.default_variant_key)
+        if variant is None:
+            return None
+        return variant.frames.wait_newer(after_seq, timeout)
+
+    def _publish_data(self, updates, capture_time=None):
+        """Publishes a new snapshot: the previous data with `updates` applied.
+
+        Neither the snapshot nor any dict inside it may be modified once
+        published; writers always replace whole entries.
+        """
+        with self.publish_lock:
+            previous = self.snapshots.value
+            data = dict(previous.data)
+            data.update(updates)
+            snapshot = DetectionSnapshot(
+                previous.seq + 1,
+                capture_time if capture_time is not None else time.time(),
+                data,
+            )
+            self.snapshots.publish(snapshot)
+        return snapshot
+
+    def get_latest_snapshot(self):
+        return self.snapshots.value
+
+    def wait_for_snapshot(self, after_seq, timeout=None):
+        """Blocks until a snapshot newer than `after_seq` exists; None on timeout."""
+        return self.snapshots.wait_newer(after_seq, timeout)
 
     def get_latest_data(self):
-        with self.lock:
-            return copy.deepcopy(self.latest_data)
+        """Returns the latest detection dict. Callers must treat it as read-only."""
+        return self.snapshots.value.data
+
+
+def _blob_rect(blob):
+    x0 = blob.cx() - blob.w() // 2
+    y0 = blob.cy() - blob.h() // 2
+    return x0, y0, x0 + blob.w(), y0 + blob.h()
+
+
+def _merge_overlapping_blobs(blobs):
+    """Groups blobs whose bounding boxes overlap (transitively)."""
+    groups = []
+    for blob in blobs:
+        rect = _blob_rect(blob)
+        merged = [blob]
+        # 合并后矩形变大, 可能又和前面已检查过的组重叠, 所以重复扫描直到没有合并
+        changed = True
+        while changed:
+            changed = False
+            for group in groups[:]:
+                g_rect = group[0]
+                if (
+                    rect[0] <= g_rect[2]
+                    and g_rect[0] <= rect[2]
+                    and rect[1] <= g_rect[3]
+                    and g_rect[1] <= rect[3]
+                ):
+                    groups.remove(group)
+                    merged.extend(group[1])
+                    rect = (
+                        min(rect[0], g_rect[0]),
+                        min(rect[1], g_rect[1]),
+                        max(rect[2], g_rect[2]),
+                        max(rect[3], g_rect[3]),
+                    )
+                    changed = True
+        groups.append((rect, merged))
+    return [members for _, members in groups]
+
+
+def _organ_info_text(info):
+    return "\n".join(
+        [
+            f"编号: {info.get('编号')}",
+            f"类型: {info.get('类型')}",
+            f"供体: {info.get('供体')}",
+            f"位置: {info.get('位置')}",
+        ]
+    )
+
+
+def _organ_display_str(info):
+    return f"{info.get('编号')} {info.get('类型')}"
+
+
+def format_qr_payload(payload, registry):
+    """Raw QR payload -> (show_info, display_str), looked up in `registry`."""
+    try:
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        data = json.loads(payload)
+        code = data.get("编号")
+        info = registry.get(code) if code else None
+        if info:
+            return _organ_info_text(info), _organ_display_str(info)
+        show_info = "\n".join(f"{k}: {v}" for k, v in data.items())
+        key, value = next(iter(data.items()))
+        return show_info, f"{key}: {value}"
+    except Exception:
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        info = registry.get(payload)
+        if info:
+            return _organ_info_text(info), _organ_display_str(info)
+        return payload, payload[:10]
+
+
+def _qr_payload_cache(registry):
+    """`format_qr_payload` bound to one registry, behind an LRU cache.
+
+    The cache belongs to the registry it was built for: replacing the
+    registry drops it, so no entries (or registries) outlive the swap.
+    """
+    return functools.lru_cache(maxsize=QR_PAYLOAD_CACHE_SIZE)(
+        functools.partial(format_qr_payload, registry=registry)
+    )
+
+
+def _max_corner_shift(corners_a, corners_b):
+    return max(
+        max(abs(a[0] - b[0]), abs(a[1] - b[1])) for a, b in zip(corners_a, corners_b)
+    )
+
+
+def encode_jpeg(img, quality=JPEG_QUALITY):
+    """Encode a frame to JPEG bytes entirely in memory."""
+    try:
+        jpeg = img.to_jpeg(quality=quality)
+        return jpeg.to_bytes() if jpeg else None
+    except Exception as e:
+        print(f"!!! JPEG encode failed: {e}")
+        return None
 
 
 def calculate_angle_from_corners(corners):
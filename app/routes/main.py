@@ -1,23 +1,45 @@
 # app/routes/main.py
-from flask import Blueprint, render_template, Response, jsonify, request, current_app
+from flask import (
+    Blueprint,
+    render_template,
+    Response,
+    jsonify,
+    request,
+    current_app,
+    g,
+    url_for,
+)
 import time
 import os
+import math
 import signal
 from .. import stop_background_threads, start_background_services
+from ..modules.streaming import MJPEG_BOUNDARY
+from ..modules.metrics import REGISTRY
+from ..modules.frame_ring import dump_entries
 
 main_bp = Blueprint("main", __name__)
 
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_seconds",
+    "Time spent in a Flask request handler (streaming bodies not included).",
+    ("endpoint", "method", "status"),
+)
+
+
+@main_bp.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
 
-# ... (gen_frames, index, video_feed 无变化) ...
-def gen_frames(app):
-    with app.app_context():
-        while True:
-            frame = current_app.vision_processor.get_latest_frame()
-            if frame:
-                yield (
-                    b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-                )
-            time.sleep(0.05)
+
+@main_bp.after_request
+def _observe_request_time(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.labels(
+            request.endpoint or "unknown", request.method, response.status_code
+        ).observe(time.perf_counter() - started)
+    return response
 
 
 @main_bp.route("/")
@@ -27,10 +49,196 @@ def index():
 
 @main_bp.route("/video_feed")
 def video_feed():
-    return Response(
-        gen_frames(current_app._get_current_object()),
-        mimetype="multipart/x-mixed-replace; boundary=frame",
+    # --- [核心修改] 所有观看者共享同一个广播器，每帧只打包一次 ---
+    # 可选参数: size=160x120, quality=50, fps=10
+    width = height = None
+    size = request.args.get("size")
+    if size:
+        try:
+            width, height = (int(v) for v in size.lower().split("x"))
+        except ValueError:
+            return jsonify(status="error", message="size 格式应为 宽x高"), 400
+        vision_processor = current_app.vision_processor
+        if not (
+            0 < width <= vision_processor.width
+            and 0 < height <= vision_processor.height
+        ):
+            return (
+                jsonify(
+                    status="error",
+                    message=f"size 不能超过 {vision_processor.width}x{vision_processor.height}",
+                ),
+                400,
+            )
+    quality = request.args.get("quality", type=int)
+    if quality is not None and not 1 <= quality <= 100:
+        return jsonify(status="error", message="quality 应在 1~100 之间"), 400
+    max_fps = request.args.get("fps", type=float)
+    if max_fps is not None and max_fps <= 0:
+        return jsonify(status="error", message="fps 必须大于0"), 400
+
+    broadcaster = current_app.stream_broadcaster
+    client, reason = broadcaster.subscribe(
+        request.remote_addr, width, height, quality, max_fps
+    )
+    if client is None:
+        return jsonify(status="error", message=reason), 503
+    response = Response(
+        broadcaster.stream(client),
+        mimetype=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
     )
+    response.call_on_close(lambda: broadcaster.unsubscribe(client))
+    return response
+
+
+@main_bp.route("/api/stream_clients", methods=["GET"])
+def get_stream_clients():
+    return jsonify(current_app.stream_broadcaster.get_stats())
+
+
+@main_bp.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@main_bp.route("/api/vision_pipeline_stats", methods=["GET"])
+def get_vision_pipeline_stats():
+    return jsonify(current_app.vision_processor.get_pipeline_stats())
+
+
+@main_bp.route("/api/detector_schedule", methods=["GET"])
+def get_detector_schedule():
+    return jsonify(current_app.vision_processor.get_detector_schedule())
+
+
+@main_bp.route("/api/detector_schedule", methods=["POST"])
+def set_detector_schedule():
+    data = request.json or {}
+    detector = data.get("detector")
+    if not detector:
+        return jsonify(status="error", message="No detector provided"), 400
+    changes = {
+        key: data[key] for key in ("every_n", "rate_hz", "budget_ms") if key in data
+    }
+    success, message = current_app.vision_processor.set_detector_schedule(
+        detector, **changes
+    )
+    if success:
+        return jsonify(status="success", message=message)
+    else:
+        return jsonify(status="error", message=message), 400
+
+
+@main_bp.route("/api/roi_mode", methods=["GET"])
+def get_roi_mode():
+    return jsonify(current_app.vision_processor.get_roi_stats())
+
+
+@main_bp.route("/api/roi_mode", methods=["POST"])
+def set_roi_mode():
+    data = request.json or {}
+    detector = data.get("detector")
+    enabled = data.get("enabled")
+    if not detector or enabled is None:
+        return (
+            jsonify(status="error", message="No detector or enabled flag provided"),
+            400,
+        )
+    # "false" / "0" 之类的字符串在 Python 里为真, 只接受 JSON 布尔值
+    if not isinstance(enabled, bool):
+        return jsonify(status="error", message="enabled must be true or false"), 400
+    success, message = current_app.vision_processor.set_roi_mode(detector, enabled)
+    if success:
+        return jsonify(status="success", message=message)
+    else:
+        return jsonify(status="error", message=message), 400
+
+
+@main_bp.route("/api/events")
+def events():
+    # --- [新增] Server-Sent Events：只推送发生变化的数据 ---
+    hub = current_app.event_hub
+    queue = hub.subscribe(current_app.status_publisher.initial_events())
+    response = Response(hub.stream(queue), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(lambda: hub.unsubscribe(queue))
+    return response
+
+
+@main_bp.route("/api/frame_ring", methods=["GET"])
+def get_frame_ring_stats():
+    frame_ring = current_app.vision_processor.frame_ring
+    if frame_ring is None:
+        return jsonify(enabled=False)
+    return jsonify(dict(frame_ring.get_stats(), enabled=True))
+
+
+@main_bp.route("/api/frame_at", methods=["GET"])
+def get_frame_at():
+    # 取出最接近时间戳 t (Unix秒) 的那一帧及其检测结果
+    frame_ring = current_app.vision_processor.frame_ring
+    if frame_ring is None:
+        return jsonify(status="error", message="回放缓冲区未启用"), 404
+    timestamp = request.args.get("t", type=float)
+    if timestamp is None or not math.isfinite(timestamp):
+        return jsonify(status="error", message="缺少参数 t"), 400
+    entry = frame_ring.nearest(timestamp)
+    if entry is None:
+        return jsonify(status="error", message="缓冲区为空"), 404
+    # 检测结果可能有几 KB, 放在响应体里而不是响应头; 图像按 seq 另行获取
+    snapshot = entry["snapshot"]
+    return jsonify(
+        timestamp=entry["timestamp"],
+        seq=entry["seq"],
+        detection=snapshot.data if snapshot else None,
+        jpeg=url_for("main.get_frame_jpeg", seq=entry["seq"]),
+    )
+
+
+@main_bp.route("/api/frame/<int:seq>.jpg", methods=["GET"])
+def get_frame_jpeg(seq):
+    frame_ring = current_app.vision_processor.frame_ring
+    if frame_ring is None:
+        return jsonify(status="error", message="回放缓冲区未启用"), 404
+    entry = frame_ring.get(seq)
+    if entry is None:
+        return jsonify(status="error", message="该帧已不在缓冲区中"), 404
+    response = Response(entry["jpeg"], mimetype="image/jpeg")
+    response.headers["X-Frame-Timestamp"] = repr(entry["timestamp"])
+    response.headers["X-Frame-Seq"] = str(entry["seq"])
+    return response
+
+
+@main_bp.route("/api/frame_dump", methods=["POST"])
+def dump_frame_window():
+    # 导出一个时间窗口: {"start": ..., "end": ...} 或 {"t": ..., "before": 2, "after": 1}
+    frame_ring = current_app.vision_processor.frame_ring
+    if frame_ring is None:
+        return jsonify(status="error", message="回放缓冲区未启用"), 404
+    data = request.json or {}
+    try:
+        if "t" in data:
+            center = float(data["t"])
+            start = center - float(data.get("before", 2.0))
+            end = center + float(data.get("after", 1.0))
+        else:
+            start, end = float(data["start"]), float(data["end"])
+        # NaN / inf / 超出范围的时间戳会让 localtime 抛异常
+        if not (math.isfinite(start) and math.isfinite(end)):
+            raise ValueError("non-finite time")
+        name = time.strftime("%Y%m%d_%H%M%S", time.localtime(start))
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        return jsonify(status="error", message="需要 t 或 start/end (Unix秒)"), 400
+    entries = frame_ring.window(start, end)
+    if not entries:
+        return jsonify(status="error", message="该时间段内没有缓存的帧"), 404
+    directory = os.path.join(
+        current_app.config.get("FRAME_DUMP_DIR", "frame_dumps"),
+        f"{name}_{entries[0]['seq']}",
+    )
+    count = dump_entries(entries, directory)
+    return jsonify(status="success", path=directory, frames=count)
 
 
 @main_bp.route("/api/system_status", methods=["GET"])
@@ -54,8 +262,15 @@ def simulate_task2_start():
 
 @main_bp.route("/api/detection_data", methods=["GET"])
 def get_detection_data():
-    data = current_app.vision_processor.get_latest_data()
-    return jsonify(data)
+    vision_processor = current_app.vision_processor
+    after = request.args.get("after", type=int)
+    snapshot = None
+    if after is not None:
+        # 长轮询：等待比 after 更新的快照，最多1秒
+        snapshot = vision_processor.wait_for_snapshot(after, timeout=1.0)
+    if snapshot is None:
+        snapshot = vision_processor.get_latest_snapshot()
+    return jsonify(dict(snapshot.data, seq=snapshot.seq, timestamp=snapshot.timestamp))
 
 
 # --- [核心修改] 此API现在是执行Task2的唯一入口 ---
@@ -113,6 +328,16 @@ def get_arm_sent_log():
     return jsonify({"log": log})
 
 
+@main_bp.route("/api/serial_stats", methods=["GET"])
+def get_serial_stats():
+    return jsonify(
+        {
+            "arm": current_app.arm_controller.get_serial_stats(),
+            "car": current_app.car_controller.get_serial_stats(),
+        }
+    )
+
+
 @main_bp.route("/api/arm_vision_stream_status", methods=["GET"])
 def get_arm_vision_stream_status():
     status = current_app.arm_controller.get_vision_stream_status()
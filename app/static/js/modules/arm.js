@@ -1,4 +1,5 @@
 // app/static/js/modules/arm.js
+import { subscribeEvent, prependLogEntry } from './events.js';
 
 export function initArm() {
     const receivedLogEl = document.getElementById('arm-log-received');
@@ -42,24 +43,30 @@ export function initArm() {
     }
 
     let isUpdatingSwitch = false;
+    function updateVisionStreamSwitches(isActive) {
+        isUpdatingSwitch = true;
+        allSwitches.forEach(sw => {
+            if (sw.checked !== isActive) {
+                sw.checked = isActive;
+            }
+        });
+        setTimeout(() => { isUpdatingSwitch = false; }, 100);
+    }
+
     function fetchVisionStreamStatus() {
         fetch('/api/arm_vision_stream_status')
             .then(res => res.json())
-            .then(data => {
-                isUpdatingSwitch = true;
-                allSwitches.forEach(sw => {
-                    if (sw.checked !== data.is_active) {
-                        sw.checked = data.is_active;
-                    }
-                });
-                setTimeout(() => { isUpdatingSwitch = false; }, 100);
-            })
+            .then(data => updateVisionStreamSwitches(data.is_active))
             .catch(error => console.error('获取视觉流状态失败:', error));
     }
 
-    setInterval(fetchArmStatus, 1000);
-    setInterval(fetchArmSentLog, 1000);
-    setInterval(fetchVisionStreamStatus, 1000);
+    // --- [核心修改] 初始化时获取一次完整日志，之后只接收服务器推送的新条目 ---
+    fetchArmStatus();
+    fetchArmSentLog();
+    fetchVisionStreamStatus();
+    subscribeEvent('arm_log', data => prependLogEntry(receivedLogEl, `< ${data.entry}`));
+    subscribeEvent('arm_sent_log', data => prependLogEntry(visionLogEl, `> ${data.entry}`));
+    subscribeEvent('state', data => updateVisionStreamSwitches(data.arm_vision_stream));
 
     allSwitches.forEach(sw => {
         sw.addEventListener('change', function () {
@@ -1,4 +1,5 @@
 // 文件: app/static/js/modules/car.js (最终修正版)
+import { subscribeEvent, prependLogEntry } from './events.js';
 
 export function initCarControls() {
     // --- 获取所有需要交互的UI元素 ---
@@ -73,7 +74,9 @@ export function initCarControls() {
             .catch(error => console.error('获取小车发送日志失败:', error));
     }
 
-    // --- [修改] 设置定时器，同时获取接收和发送的日志 ---
-    setInterval(fetchCarStatus, 1000); // 周期可以调整，比如1秒
-    setInterval(fetchCarSentLog, 1000);
+    // --- [核心修改] 初始化时获取一次完整日志，之后只接收服务器推送的新条目 ---
+    fetchCarStatus();
+    fetchCarSentLog();
+    subscribeEvent('car_log', data => prependLogEntry(carLogReceivedEl, `< ${data.entry}`));
+    subscribeEvent('car_sent_log', data => prependLogEntry(carLogSentEl, `> ${data.entry}`));
 }
\ No newline at end of file
@@ -1,4 +1,5 @@
 // app/static/js/modules/detection.js
+import { subscribeEvent } from './events.js';
 
 export function initDetection() {
     // --- 获取UI元素 ---
@@ -26,9 +27,24 @@ export function initDetection() {
         if (colorHex) {
             // 使用内联样式来动态改变背景（小圆点）
             selectElement.style.backgroundImage = `url('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" width="12" height="12" viewBox="0 0 12 12"><circle cx="6" cy="6" r="6" fill="${colorHex.replace("#", "%23")}"/></svg>')`;
+        } else {
+            selectElement.style.backgroundImage = 'none';
         }
     }
 
+    // --- [新增] 多颜色模式下按颜色列出所有色块 ---
+    function formatMultiColorBlobs(cb) {
+        const lines = [];
+        Object.entries(cb.blobs || {}).forEach(([color, blobs]) => {
+            if (!blobs.length) return;
+            lines.push(`${color} (${blobs.length}):`);
+            blobs.forEach(b => {
+                lines.push(`  x: ${b.offset_x}, y: ${b.offset_y}, w: ${b.w}, h: ${b.h}, angle: ${b.angle.toFixed(1)}`);
+            });
+        });
+        return lines.length ? lines.join('\n') : '未检测到';
+    }
+
     if (blobColorSelect) {
         blobColorSelect.addEventListener('change', function () {
             const selectedColor = this.value;
@@ -61,6 +77,10 @@ export function initDetection() {
                     } else if (featureName === 'qrcode') {
                         updateUiState(qrcodeDataEl, isEnabled);
                     }
+                    // 只有变化才会推送，重新启用时先显示最近一次的数据
+                    if (isEnabled && lastDetectionData) {
+                        renderDetectionData(lastDetectionData);
+                    }
                 });
         });
     }
@@ -93,50 +113,55 @@ export function initDetection() {
         }
     }
 
-    function fetchDetectionData() {
-        fetch('/api/detection_data')
-            .then(response => response.ok ? response.json() : Promise.reject('Network error'))
-            .then(data => {
-                if (nanotrackPanel && nanotrackDataEl) {
-                    if (data.nanotrack && data.nanotrack.detected) {
-                        const track = data.nanotrack;
-                        nanotrackPanel.style.display = 'block';
-                        nanotrackDataEl.textContent = `状态: ${track.status}\n置信度: ${track.score}\nx: ${track.x}, y: ${track.y}, w: ${track.w}, h: ${track.h}`;
-                    } else {
-                        nanotrackPanel.style.display = 'none';
-                    }
-                }
-
-                if (blobToggleSwitch && colorBlockDataEl && blobToggleSwitch.checked) {
-                    if (data.color_block && data.color_block.detected) {
-                        const cb = data.color_block;
-                        colorBlockDataEl.textContent = `颜色: ${cb.color_name} (索引:${cb.color_index})\noffset_x: ${cb.offset_x}, offset_y: ${cb.offset_y}\nw: ${cb.w}, h: ${cb.h}, angle: ${cb.angle.toFixed(1)}`;
-                    } else {
-                        colorBlockDataEl.textContent = '未检测到';
-                    }
-                }
-
-                if (apriltagDataEl) {
-                    if (data.apriltag && data.apriltag.detected) {
-                        const tag = data.apriltag;
-                        apriltagDataEl.textContent = `id: ${tag.id}\noffset_x: ${tag.offset_x}, offset_y: ${tag.offset_y}\ndistance: ${tag.distance}`;
-                    } else {
-                        apriltagDataEl.textContent = '未检测到';
-                    }
-                }
+    let lastDetectionData = null;
 
-                if (qrcodeToggleSwitch && qrcodeDataEl && qrcodeToggleSwitch.checked) {
-                    if (data.qrcode && data.qrcode.detected) {
-                        qrcodeDataEl.textContent = formatJsonPayload(data.qrcode.payload);
-                    } else {
-                        qrcodeDataEl.textContent = '未检测到';
-                    }
-                }
-            })
-            .catch(error => console.error('获取检测数据失败:', error));
+    function renderDetectionData(data) {
+        lastDetectionData = data;
+        if (nanotrackPanel && nanotrackDataEl) {
+            if (data.nanotrack && data.nanotrack.detected) {
+                const track = data.nanotrack;
+                nanotrackPanel.style.display = 'block';
+                nanotrackDataEl.textContent = `状态: ${track.status}\n置信度: ${track.score}\nx: ${track.x}, y: ${track.y}, w: ${track.w}, h: ${track.h}`;
+            } else if (data.nanotrack && data.nanotrack.status === 'RECOVERING') {
+                // 跟丢后正在自动重新捕获目标
+                nanotrackPanel.style.display = 'block';
+                nanotrackDataEl.textContent = `状态: RECOVERING\n搜索窗口: ${data.nanotrack.window.join(', ')}`;
+            } else {
+                nanotrackPanel.style.display = 'none';
+            }
+        }
+
+        if (blobToggleSwitch && colorBlockDataEl && blobToggleSwitch.checked) {
+            if (data.color_block && data.color_block.mode === 'multi') {
+                colorBlockDataEl.textContent = formatMultiColorBlobs(data.color_block);
+            } else if (data.color_block && data.color_block.detected) {
+                const cb = data.color_block;
+                colorBlockDataEl.textContent = `颜色: ${cb.color_name} (索引:${cb.color_index})\noffset_x: ${cb.offset_x}, offset_y: ${cb.offset_y}\nw: ${cb.w}, h: ${cb.h}, angle: ${cb.angle.toFixed(1)}`;
+            } else {
+                colorBlockDataEl.textContent = '未检测到';
+            }
+        }
+
+        if (apriltagDataEl) {
+            if (data.apriltag && data.apriltag.detected) {
+                const tag = data.apriltag;
+                apriltagDataEl.textContent = `id: ${tag.id}\noffset_x: ${tag.offset_x}, offset_y: ${tag.offset_y}\ndistance: ${tag.distance}`;
+            } else {
+                apriltagDataEl.textContent = '未检测到';
+            }
+        }
+
+        if (qrcodeToggleSwitch && qrcodeDataEl && qrcodeToggleSwitch.checked) {
+            if (data.qrcode && data.qrcode.detected) {
+                qrcodeDataEl.textContent = formatJsonPayload(data.qrcode.payload);
+            } else {
+                qrcodeDataEl.textContent = '未检测到';
+            }
+        }
     }
 
-    setInterval(fetchDetectionData, 200);
+    // --- [核心修改] 由服务器推送检测结果，不再每200ms轮询 ---
+    subscribeEvent('detection', renderDetectionData);
     updateUiState(colorBlockDataEl, blobToggleSwitch ? blobToggleSwitch.checked : false);
     updateUiState(qrcodeDataEl, qrcodeToggleSwitch ? qrcodeToggleSwitch.checked : false);
 }
\ No newline at end of file
@@ -0,0 +1,42 @@
+// app/static/js/modules/events.js
+// 所有模块共享同一个 /api/events 连接 (Server-Sent Events)，浏览器断线后会自动重连
+
+let eventSource = null;
+const handlers = {};
+
+function getEventSource() {
+    if (!eventSource) {
+        eventSource = new EventSource('/api/events');
+        eventSource.onerror = () => console.warn('事件流连接中断，浏览器将自动重连...');
+    }
+    return eventSource;
+}
+
+export function subscribeEvent(eventType, handler) {
+    const source = getEventSource();
+    if (!handlers[eventType]) {
+        handlers[eventType] = [];
+        source.addEventListener(eventType, (e) => {
+            let data;
+            try {
+                data = JSON.parse(e.data);
+            } catch (err) {
+                console.error(`解析事件 ${eventType} 失败:`, err);
+                return;
+            }
+            handlers[eventType].forEach(h => h(data));
+        });
+    }
+    handlers[eventType].push(handler);
+}
+
+// 把一条新日志插入到日志框最上方，并限制条数
+export function prependLogEntry(logEl, text, maxEntries = 50) {
+    if (!logEl) return;
+    const p = document.createElement('p');
+    p.textContent = text;
+    logEl.insertBefore(p, logEl.firstChild);
+    while (logEl.children.length > maxEntries) {
+        logEl.removeChild(logEl.lastChild);
+    }
+}
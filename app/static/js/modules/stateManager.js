@@ -1,4 +1,5 @@
 // app/static/js/modules/stateManager.js
+import { subscribeEvent } from './events.js';
 
 const MANAGED_COMPONENTS = {
     carControls: document.querySelector('.panel-car-control'),
@@ -63,5 +64,7 @@ async function fetchSystemStatus() {
 
 export function initStateManager() {
     console.log("State Manager initialized.");
-    setInterval(fetchSystemStatus, 1000);
+    // --- [核心修改] 先获取一次当前状态，之后由服务器推送状态变化 ---
+    fetchSystemStatus();
+    subscribeEvent('state', data => updateUiLockState(data.status));
 }
\ No newline at end of file
@@ -0,0 +1,265 @@
+# bench_vision.py
+# 视觉检测基准测试: 在固定的帧集合上直接驱动 VisionProcessor 的各个检测器,
+# 以 JSON 输出每个阶段的 fps 与 p50/p95/p99 延迟, 便于发现性能回退、对比不同配置。
+#
+# 用法 (开发机上自动使用 MOCK 模式):
+#   python bench_vision.py                          # 全部预设配置, 合成画面
+#   python bench_vision.py --configs baseline,roi --frames 300
+#   python bench_vision.py --source recordings/run1 # JPEG目录 / .raw 帧转储 / 视频
+#   python bench_vision.py --output new.json --compare old.json --max-regression 1.2
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+import numpy as np
+
+# 模块与处理器的日志输出到 stderr, stdout 只留给 JSON 报告
+with contextlib.redirect_stdout(sys.stderr):
+    from app.modules import vision
+    from app.modules.vision import (
+        VisionProcessor,
+        VisionState,
+        DETECTOR_SCHEDULE_DEFAULTS,
+        NANOTRACK_MODEL_PATH,
+        MULTI_COLOR_KEY,
+        encode_jpeg,
+    )
+
+# --- 预设配置: roi=是否启用窗口搜索, color=色块颜色, schedule=None 表示每帧都运行所有检测器 ---
+PRESETS = {
+    "baseline": {"roi": False, "color": "blue", "schedule": None},
+    "roi": {"roi": True, "color": "blue", "schedule": None},
+    "multi_color": {"roi": False, "color": MULTI_COLOR_KEY, "schedule": None},
+    "scheduled": {
+        "roi": True,
+        "color": "blue",
+        "schedule": DETECTOR_SCHEDULE_DEFAULTS,
+    },
+    "tracking": {"roi": False, "color": "blue", "schedule": None, "track": True},
+}
+IDLE_DETECTORS = ("color_block", "apriltag", "qrcode")
+
+
+def load_frames(width, height, count, source_path=None):
+    """Fixed, reproducible frame set: a recording or the synthetic scene."""
+    if source_path:
+        from app.modules.frame_sources import open_frame_source
+        from app.modules.maix_mock import MockImage
+
+        source = open_frame_source(
+            source_path, width, height, loop=False, max_frames=count
+        )
+        return [MockImage(width, height, pixels=f) for f in source.frames], {
+            "source": source.name,
+            "path": source_path,
+        }
+
+    from app.modules.maix_mock import MockImage
+
+    frames = []
+    for i in range(count):
+        img = MockImage(width, height)
+        img._update_object_positions(t=i / 30.0)
+        frames.append(img)
+    return frames, {"source": "synthetic"}
+
+
+def latency_summary(samples_ms, wall_s=None):
+    if not samples_ms:
+        return {"calls": 0}
+    samples = np.asarray(samples_ms)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    summary = {
+        "calls": len(samples),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+    if wall_s:
+        summary["fps"] = round(len(samples) / wall_s, 1)
+    return summary
+
+
+def configure(vp, preset):
+    for roi_tracker in vp.rois.values():
+        roi_tracker.set_enabled(preset["roi"])
+    vp.set_blob_color_key(preset["color"])
+    schedule = preset["schedule"]
+    for name in IDLE_DETECTORS:
+        config = (schedule or {}).get(name, {})
+        vp.set_detector_schedule(
+            name,
+            every_n=config.get("every_n", 1),
+            rate_hz=config.get("rate_hz"),
+            budget_ms=config.get("budget_ms"),
+        )
+    # 每个配置都从虚拟时钟 0 开始, 不能沿用上一个配置留下的运行时间
+    vp.scheduler.reset()
+
+
+def run_config(vp, frames, preset, camera_fps, quality, repeat):
+    """Runs one preset over the frame set and returns per-stage latencies.
+
+    Time-based schedules (rate_hz) are evaluated against a virtual clock
+    advancing 1/camera_fps per frame, so skip ratios match a real camera
+    no matter how fast the benchmark itself runs.
+    """
+    configure(vp, preset)
+    samples = {name: [] for name in IDLE_DETECTORS + ("nanotrack",)}
+    samples.update(overlay=[], encode=[], frame=[])
+
+    def timed(name, detect_fn):
+        def run(img, overlay):
+            started = time.perf_counter()
+            result = detect_fn(img, overlay)
+            samples[name].append((time.perf_counter() - started) * 1000)
+            return result
+
+        return run
+
+    detectors = [
+        ("color_block", timed("color_block", vp._detect_blobs)),
+        ("apriltag", timed("apriltag", vp._detect_apriltags)),
+        ("qrcode", timed("qrcode", vp._detect_qrcodes)),
+    ]
+    track = timed("nanotrack", vp._track_target)
+    if preset.get("track"):
+        if vp.tracker is None:
+            vp.tracker = vision.nn.NanoTrack(model=NANOTRACK_MODEL_PATH)
+        vp.tracker.init(frames[0], 0, 0, 40, 40)
+        vp.state = VisionState.TRACKING
+
+    base_clock = 0.0
+    wall_started = time.perf_counter()
+    for _ in range(repeat):
+        for i, img in enumerate(frames):
+            now = base_clock + i / camera_fps
+            # 叠加绘制会修改图像, 在副本上进行以保证帧集合在各配置间保持一致;
+            # 复制不属于任何阶段, 放在计时之外
+            frame_img = img.copy()
+            started = time.perf_counter()
+            overlays = []
+            if preset.get("track"):
+                overlay = vision.OverlayRecorder()
+                track(img, overlay)
+                overlays.append(overlay)
+            else:
+                for name, detect_fn in detectors:
+                    vp._run_detector(name, detect_fn, img, now, overlays)
+
+            overlay_started = time.perf_counter()
+            for overlay in overlays:
+                overlay.apply(frame_img)
+            samples["overlay"].append((time.perf_counter() - overlay_started) * 1000)
+
+            encode_started = time.perf_counter()
+            encode_jpeg(frame_img, quality)
+            samples["encode"].append((time.perf_counter() - encode_started) * 1000)
+            samples["frame"].append((time.perf_counter() - started) * 1000)
+        base_clock += len(frames) / camera_fps
+    wall_s = time.perf_counter() - wall_started
+
+    vp.state = VisionState.IDLE
+    stages = {name: latency_summary(values) for name, values in samples.items()}
+    stages["frame"] = latency_summary(samples["frame"], wall_s)
+    return {
+        "settings": {k: v for k, v in preset.items() if k != "schedule"},
+        "schedule": vp.scheduler.get_config(),
+        "fps": stages["frame"].get("fps", 0.0),
+        "stages": stages,
+        "run_ratio": (
+            {}
+            if preset.get("track")
+            else {
+                name: stats["run_ratio"]
+                for name, stats in vp.scheduler.get_stats().items()
+            }
+        ),
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Lists stages whose p95 grew by more than `max_regression` times."""
+    regressions = []
+    for config_name, config in report["configs"].items():
+        old_config = baseline.get("configs", {}).get(config_name)
+        if not old_config:
+            continue
+        for stage, stats in config["stages"].items():
+            old_p95 = old_config["stages"].get(stage, {}).get("p95_ms")
+            new_p95 = stats.get("p95_ms")
+            if old_p95 and new_p95 and new_p95 > old_p95 * max_regression:
+                regressions.append(
+                    {
+                        "config": config_name,
+                        "stage": stage,
+                        "old_p95_ms": old_p95,
+                        "new_p95_ms": new_p95,
+                        "ratio": round(new_p95 / old_p95, 2),
+                    }
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vision detector benchmark")
+    parser.add_argument(
+        "--configs",
+        default=",".join(PRESETS),
+        help=f"comma separated presets ({', '.join(PRESETS)})",
+    )
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--source", help="JPEG directory, .raw dump or video file")
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--camera-fps", type=float, default=30.0)
+    parser.add_argument("--quality", type=int, default=vision.JPEG_QUALITY)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    config_names = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in config_names if name not in PRESETS]
+    if unknown:
+        parser.error(f"unknown config(s): {', '.join(unknown)}")
+
+    frames, source_info = load_frames(args.width, args.height, args.frames, args.source)
+    report = {
+        "frames": len(frames),
+        "repeat": args.repeat,
+        "resolution": [args.width, args.height],
+        "camera_fps": args.camera_fps,
+        "jpeg_quality": args.quality,
+        "frame_source": source_info,
+        "configs": {},
+    }
+    for name in config_names:
+        # 每个配置使用新的处理器, 避免上一个配置的 ROI / 调度状态影响结果
+        with contextlib.redirect_stdout(sys.stderr):
+            vp = VisionProcessor(args.width, args.height)
+            report["configs"][name] = run_config(
+                vp, frames, PRESETS[name], args.camera_fps, args.quality, args.repeat
+            )
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(report, json.load(f), args.max_regression)
+        exit_code = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,3 +3,18 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or "you-will-never-guess"
+    # /video_feed 同时在线的最大观看人数 (0 表示不限制)
+    MAX_STREAM_VIEWERS = int(os.environ.get("MAX_STREAM_VIEWERS", 5))
+    # 样本库 (SQLite, 由 import_samples.py 生成)；文件不存在时使用 vision.ORGANS_INFO
+    SAMPLE_REGISTRY_PATH = os.environ.get(
+        "SAMPLE_REGISTRY_PATH", "/root/data/samples.db"
+    )
+    # 回放缓冲区: 保留最近N帧及检测结果 (0 表示关闭)，每帧JPEG最大字节数，导出目录
+    FRAME_RING_CAPACITY = int(os.environ.get("FRAME_RING_CAPACITY", 0))
+    FRAME_RING_SLOT_BYTES = int(os.environ.get("FRAME_RING_SLOT_BYTES", 64 * 1024))
+    FRAME_DUMP_DIR = os.environ.get("FRAME_DUMP_DIR", "/root/frame_dumps")
+    # 视觉数据发给机械臂: 最大频率 (次/秒)，目标不动时的补发间隔 (秒)
+    ARM_VISION_MAX_RATE = float(os.environ.get("ARM_VISION_MAX_RATE", 20))
+    ARM_VISION_KEEPALIVE = float(os.environ.get("ARM_VISION_KEEPALIVE", 1.0))
+    # 1: 每帧的所有色块和AprilTag合并成一个 0x03 包发送 (需要机械臂固件支持)
+    ARM_VISION_BATCH = os.environ.get("ARM_VISION_BATCH", "0") == "1"
@@ -0,0 +1,56 @@
+# import_samples.py
+# 批量导入样本信息到样本库 (SQLite), 供二维码识别按 编号 查询。
+#
+# 用法:
+#   python import_samples.py samples.csv                 # 写入 Config.SAMPLE_REGISTRY_PATH
+#   python import_samples.py samples.jsonl --db /tmp/samples.db
+#
+# CSV 需要表头, 至少包含 "编号" 列; "架"/"盒" 两列会合并为 位置 字段,
+# 其余列原样保存。JSON Lines 每行一个对象, 格式与 vision.ORGANS_INFO 的值相同。
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from config import Config
+from app.modules.sample_registry import import_samples
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            record = {k: v for k, v in row.items() if k not in ("架", "盒")}
+            if "架" in row or "盒" in row:
+                record["位置"] = {"架": row.get("架"), "盒": row.get("盒")}
+            yield record
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import samples")
+    parser.add_argument("source", help="CSV (with header) or JSON Lines file")
+    parser.add_argument("--db", default=Config.SAMPLE_REGISTRY_PATH)
+    args = parser.parse_args(argv)
+
+    reader = read_jsonl if args.source.endswith((".jsonl", ".json")) else read_csv
+    db_dir = os.path.dirname(os.path.abspath(args.db))
+    os.makedirs(db_dir, exist_ok=True)
+
+    started = time.time()
+    written = import_samples(args.db, reader(args.source))
+    print(f"Imported {written} samples into {args.db} in {time.time() - started:.1f}s")
+    print("Restart the services (/api/soft_restart) to pick up the changes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())